@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# batchsim.py
+# Version: October 17, 2026
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+import kingandassassins as ka
+
+# Actions are indices: ('move'|'arrest'|'kill'|'attack', x, y, dir) is
+# (kind * 4 + dir) * 100 + 10 * x + y, ('reveal', x, y) is REVEAL + 10 * x + y
+# and ending the turn (None) is END, so that the legality masks of an
+# action for all the cells are contiguous
+KINDS = ('move', 'arrest', 'kill', 'attack')
+DIRS = tuple(ka.DIRECTIONS)
+REVEAL = len(KINDS) * 100 * len(DIRS)
+END = REVEAL + 100
+ACTIONS = END + 1
+
+# Code of the cell outside of the board, stored in the extra column 100
+WALL = 255
+# Cells of the ray from every cell in every direction, padded with the wall
+_RAYS = np.full((len(DIRS), 100, 10), 100, dtype=np.intp)
+for _i in range(100):
+    for _d, _name in enumerate(DIRS):
+        _ray = ka.RAYS[_i][_name]
+        _RAYS[_d, _i, :len(_ray)] = _ray
+_NEIGHBOURS = _RAYS[:, :, 0]
+_ROOF = np.array([ka.ROOF >> i & 1 for i in range(101)], dtype=bool)
+_ROOFRAYS = _ROOF[_RAYS]
+# The villager in the target cell of a push may stand on a roof
+_ROOFRAYS[:, :, 0] = False
+_DOORS = np.array([ka.DOORMASK >> i & 1 for i in range(100)], dtype=bool)
+_CARDS = np.array([(card[0], card[1], card[3]) for card in ka.CARDS], dtype=np.int16)
+_KINGSTATUS = {status: i for i, status in enumerate(ka.KINGSTATUS)}
+
+
+def action(index):
+    '''Get the action tuple (or None to end the turn) of an action index.'''
+    if index == END:
+        return None
+    if index >= REVEAL:
+        return ('reveal',) + divmod(int(index) - REVEAL, 10)
+    rest, i = divmod(int(index), 100)
+    kind, d = divmod(rest, len(DIRS))
+    return (KINDS[kind],) + divmod(i, 10) + (DIRS[d],)
+
+
+def index(action):
+    '''Get the action index of an action tuple (or None to end the turn).'''
+    if action is None:
+        return END
+    i = 10 * int(action[1]) + int(action[2])
+    if action[0] == 'reveal':
+        return REVEAL + i
+    return (KINDS.index(action[0]) * len(DIRS) + DIRS.index(action[3])) * 100 + i
+
+
+class BatchSimulator:
+    '''Class representing a batch of King & Assassins games played in lockstep.
+
+    The games are stored as stacked arrays: the codes of the people (see
+    ka.PAWNS, with an extra wall column), the king's status, the killed
+    knights and assassins, the arrested villagers and assassins, the
+    assassins (as bitmasks of their codes), the deck with the number of cards left in it, the current
+    card, the player to move and its action points. Every step applies one
+    action to every game that is not over, with the rules of
+    KingAndAssassinsState.play().
+    '''
+    def __init__(self, n):
+        self.people = np.zeros((n, 101), dtype=np.uint8)
+        self.people[:, 100] = WALL
+        self.king = np.zeros(n, dtype=np.uint8)
+        self.killed = np.zeros((n, 2), dtype=np.uint8)
+        self.arrested = np.zeros(n, dtype=np.uint8)
+        self.caught = np.zeros(n, dtype=np.uint8)
+        self.assassins = np.zeros(n, dtype=np.uint16)
+        self.deck = np.zeros((n, len(ka.CARDS)), dtype=np.uint8)
+        self.left = np.zeros(n, dtype=np.uint8)
+        self.card = np.zeros(n, dtype=np.uint8)
+        self.player = np.zeros(n, dtype=np.uint8)
+        self.ap = np.zeros((n, 2), dtype=np.int16)
+
+    def __len__(self):
+        return len(self.king)
+
+    @classmethod
+    def fromstates(cls, states):
+        '''Build a batch from states whose hidden information is known.
+
+        Pre: 'states' is a list of KingAndAssassinsState with the assassins
+             and the deck (server states or determinizations), once a card
+             has been drawn
+        '''
+        batch = cls(len(states))
+        for g, state in enumerate(states):
+            visible, hidden = state._state['visible'], state._state['hidden']
+            batch.people[g, :100] = np.frombuffer(bytes(state._people), dtype=np.uint8)
+            batch.king[g] = _KINGSTATUS[visible['king']]
+            batch.killed[g] = visible['killed']['knights'], visible['killed']['assassins']
+            batch.arrested[g] = len(visible['arrested'])
+            batch.caught[g] = len(set(visible['arrested']) & hidden['assassins'])
+            batch.assassins[g] = sum(1 << ka.CODES[name] for name in hidden['assassins'])
+            cards = [ka.CARDS.index(tuple(card)) for card in hidden['cards']]
+            batch.deck[g, :len(cards)] = cards
+            batch.left[g] = len(cards)
+            batch.card[g] = ka.CARDS.index(tuple(visible['card']))
+            batch.player[g] = state.player
+            batch.ap[g, :len(state.ap)] = state.ap
+        return batch
+
+    def winner(self):
+        '''Get the winner of every game (-1 if it is not over), as KingAndAssassinsState.winner().'''
+        board = self.people[:, :100]
+        return np.select(
+            [((board == ka.KING) & _DOORS).any(axis=1), self.left == 0, self.king == 2,
+             self.killed[:, 1] + self.caught == 3],
+            [1, 0, 0, 1], -1
+        ).astype(np.int8)
+
+    def _pushes(self, cells, directions, games):
+        # Index in the ray of the free cell where knights can push villagers
+        # (0 for a free target cell), or -1 if there is none
+        line = self.people[games[..., None], _RAYS[directions, cells]]
+        free = line == ka.EMPTY
+        blocked = (line < ka.FIRSTVILLAGER) | (line == WALL) | _ROOFRAYS[directions, cells]
+        first = np.argmax(free | blocked, axis=-1)
+        return np.where(np.take_along_axis(free, first[..., None], axis=-1)[..., 0], first, -1)
+
+    def legal(self):
+        '''Get the legality masks of the actions, as KingAndAssassinsState.choices().
+
+        Post: The returned value is an array of shape (N, ACTIONS) whose
+              rows are all False for the games that are over.
+        '''
+        n = len(self)
+        board = self.people[:, :100]
+        active = self.winner() == -1
+        one = ((self.player == 1) & active)[:, None]
+        zero = ((self.player == 0) & active)[:, None]
+        # The first action points are the king's or the assassins', the second the knights'
+        ap0, ap1 = (self.ap[:, 0] >= 1)[:, None], (self.ap[:, 1] >= 1)[:, None]
+        # The pawns that may act, by kind of action
+        king = one & ap0 & (board == ka.KING)
+        knights = one & ap1 & (board == ka.KNIGHT)
+        assassins = zero & ap0 & (board == ka.ASSASSIN)
+        villagers = board >= ka.FIRSTVILLAGER
+        movers = zero & ap0 & villagers | assassins
+        mask = np.zeros((n, ACTIONS), dtype=bool)
+        kinds = mask[:, :REVEAL].reshape(n, len(KINDS), len(DIRS), 100)
+        # The targets in every direction, as arrays of shape (N, 4, 100)
+        target = np.take(self.people, _NEIGHBOURS, axis=1)
+        free = target == ka.EMPTY
+        # Broadcast the pawns over the directions
+        king, knights, assassins, movers = king[:, None], knights[:, None], assassins[:, None], movers[:, None]
+        kinds[:, 0] = (king & ~_ROOF[_NEIGHBOURS] | movers) & free
+        kinds[:, 1] = knights & (target >= ka.FIRSTVILLAGER) & (target != WALL)
+        kinds[:, 2] = knights & (target == ka.ASSASSIN) | assassins & (target == ka.KNIGHT)
+        kinds[:, 3] = assassins & (target == ka.KING)
+        # Only the knights need to look for pushes
+        g, d, c = np.unravel_index(np.flatnonzero(np.broadcast_to(knights, target.shape)), target.shape)
+        kinds[g, 0, d, c] = self._pushes(c, d, g) >= 0
+        mask[:, REVEAL:END] = zero & villagers & (self.assassins[:, None] >> board & 1).astype(bool)
+        mask[:, END] = active
+        return mask
+
+    def randomactions(self, rng, mask=None):
+        '''Pick an action uniformly among the legal ones of every game.
+
+        Pre: 'rng' is a numpy.random.Generator, 'mask' is as returned by
+             legal() (computed if None)
+        Post: The returned value is an array of action indices, -1 for the
+              games that are over.
+        '''
+        if mask is None:
+            mask = self.legal()
+        n = len(mask)
+        rows = np.arange(n)
+        # Pick a block of 100 actions, then an action in the block, so that
+        # the whole mask is only scanned once
+        blocks = mask[:, :END].reshape(n, END // 100, 100)
+        counts = np.concatenate([blocks.sum(axis=2, dtype=np.int16), mask[:, END:].astype(np.int16)], axis=1)
+        cumulative = np.cumsum(counts, axis=1)
+        total = cumulative[:, -1]
+        rank = (rng.random(n) * total).astype(np.int16)
+        block = np.argmax(cumulative > rank[:, None], axis=1)
+        rank -= cumulative[rows, block] - counts[rows, block]
+        inblock = np.cumsum(blocks[rows, np.minimum(block, END // 100 - 1)], axis=1, dtype=np.int16)
+        cells = np.argmax(inblock > rank[:, None], axis=1)
+        return np.where(total == 0, -1, np.where(block == END // 100, END, block * 100 + cells))
+
+    def step(self, actions):
+        '''Apply one action to every game, in lockstep.
+
+        Pre: 'actions' holds one legal action index per game (see legal()),
+             or -1 for the games that are over
+        Post: The actions have been applied with the rules of
+              KingAndAssassinsState.play(), spending the action points.
+        '''
+        actions = np.asarray(actions)
+        games = np.flatnonzero((actions >= 0) & (actions != END))
+        acts = actions[games]
+        reveal = acts >= REVEAL
+        rest, cells = np.divmod(acts, 100)
+        kinds, directions = np.divmod(np.where(reveal, 0, rest), len(DIRS))
+        source = self.people[games, cells]
+        # Spend the action points: revealing is free, the king spends its own
+        column = ((self.player[games] == 1) & (source != ka.KING)).astype(np.intp)
+        self.ap[games, column] -= np.where(reveal, 0, 1).astype(np.int16)
+        # ('reveal', x, y)
+        g = games[reveal]
+        self.people[g, cells[reveal]] = ka.ASSASSIN
+        targets = _NEIGHBOURS[directions, cells]
+        # ('move', x, y, dir), pushing villagers in front of knights
+        m = ~reveal & (kinds == 0)
+        g, c, d = games[m], cells[m], directions[m]
+        first = self._pushes(c, d, g)
+        ray = _RAYS[d, c]
+        line = np.concatenate([self.people[g, c][:, None], self.people[g[:, None], ray]], axis=1)
+        for k in range(1, ray.shape[1] + 1):
+            shift = k <= first + 1
+            self.people[g[shift], ray[shift, k - 1]] = line[shift, k - 1]
+        self.people[g, c] = ka.EMPTY
+        # ('arrest', x, y, dir)
+        a = ~reveal & (kinds == 1)
+        g, t = games[a], targets[a]
+        self.caught[g] += (self.assassins[g] >> self.people[g, t] & 1).astype(np.uint8)
+        self.arrested[g] += 1
+        self.people[g, t] = ka.EMPTY
+        # ('kill', x, y, dir): the assassins kill knights, the knights assassins
+        k = ~reveal & (kinds == 2)
+        g, t = games[k], targets[k]
+        self.killed[g, (source[k] == ka.KNIGHT).astype(np.intp)] += 1
+        self.people[g, t] = ka.EMPTY
+        # ('attack', x, y, dir)
+        g = games[~reveal & (kinds == 3)]
+        self.king[g] += 1
+        # Ending the turn of player 0 draws the next card
+        ended = np.flatnonzero(actions == END)
+        g = ended[(self.player[ended] == 0) & (self.left[ended] > 0)]
+        self.left[g] -= 1
+        self.card[g] = self.deck[g, self.left[g]]
+        self.player[ended] = 1 - self.player[ended]
+        cards = _CARDS[self.card[ended]]
+        self.ap[ended] = np.where((self.player[ended] == 1)[:, None], cards[:, :2],
+                                  np.stack([cards[:, 2], np.zeros_like(cards[:, 2])], axis=1))
+
+    def playout(self, rng, maxsteps=10000):
+        '''Play random actions in every game until they are all over.
+
+        Pre: 'rng' is a numpy.random.Generator
+        Post: The returned value is the array of the winners (see winner()).
+        '''
+        for i in range(maxsteps):
+            actions = self.randomactions(rng)
+            if (actions < 0).all():
+                break
+            self.step(actions)
+        return self.winner()
+
+
+def _setup(seed):
+    # A server state with random assassins, once the first card is drawn
+    server = ka.KingAndAssassinsServer(seed=seed)
+    state = server._state
+    state.setassassins(random.Random(seed).sample(sorted(ka.POPULATION), 3))
+    state.update([], 0)
+    return state
+
+
+def _compare(batch, winners, g, state):
+    # Differences between game 'g' of the batch and 'state', as strings
+    visible = state._state['visible']
+    expected = {
+        'people': bytes(state._people),
+        'king': _KINGSTATUS[visible['king']],
+        'killed': (visible['killed']['knights'], visible['killed']['assassins']),
+        'left': len(state._state['hidden']['cards']),
+        'player': state.player,
+        'ap': tuple(state.ap) + (0,) * (2 - len(state.ap)),
+        'winner': state.winner()
+    }
+    actual = {
+        'people': batch.people[g, :100].tobytes(),
+        'king': int(batch.king[g]),
+        'killed': tuple(int(k) for k in batch.killed[g]),
+        'left': int(batch.left[g]),
+        'player': int(batch.player[g]),
+        'ap': tuple(int(p) for p in batch.ap[g]),
+        'winner': int(winners[g])
+    }
+    return ['{}: {} instead of {}'.format(key, actual[key], expected[key])
+            for key in expected if actual[key] != expected[key]]
+
+
+def check(games=64, seed=0, maxsteps=10000):
+    '''Play random games with the batch simulator and KingAndAssassinsState side by side.
+
+    Pre: -
+    Post: 'games' seeded games have been played to their end, comparing
+          the legal actions before every step and the states after it.
+          The returned value is the list of the differences found, as
+          tuples (game, step, description), empty if the rules match.
+    '''
+    states = [_setup(seed + g) for g in range(games)]
+    batch = BatchSimulator.fromstates(states)
+    rng = np.random.default_rng(seed)
+    differences = []
+    for number in range(maxsteps):
+        mask = batch.legal()
+        for g, state in enumerate(states):
+            expected = set(state.choices()) if state.winner() == -1 else set()
+            actual = {action(i) for i in np.flatnonzero(mask[g])}
+            if actual != expected:
+                differences.append((g, number, 'legal actions: {} extra, {} missing'.format(
+                    sorted(actual - expected, key=str), sorted(expected - actual, key=str))))
+        actions = batch.randomactions(rng, mask)
+        if (actions < 0).all():
+            break
+        for g, state in enumerate(states):
+            if actions[g] >= 0 and state.winner() == -1:
+                state.play(action(actions[g]))
+        batch.step(actions)
+        winners = batch.winner()
+        for g, state in enumerate(states):
+            differences += [(g, number, difference) for difference in _compare(batch, winners, g, state)]
+        if differences:
+            break
+    return differences
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='King & Assassins batch simulator')
+    parser.add_argument('--games', help='number of games played in lockstep (default: 1024)', type=int, default=1024)
+    parser.add_argument('--seed', help='seed of the first game (default: 0)', type=int, default=0)
+    parser.add_argument('--check', help='compare the rules with KingAndAssassinsState instead', action='store_true')
+    args = parser.parse_args()
+
+    if args.check:
+        differences = check(args.games, args.seed)
+        for g, number, difference in differences:
+            print('game {}, step {}: {}'.format(g, number, difference))
+        print('{} games: {}'.format(args.games, 'differences found' if differences else 'the rules match'))
+    else:
+        batch = BatchSimulator.fromstates([_setup(args.seed + g) for g in range(args.games)])
+        start = time.perf_counter()
+        winners = batch.playout(np.random.default_rng(args.seed))
+        elapsed = time.perf_counter() - start
+        print('{} random playouts in {:.3f} s: {} wins for player 0, {} for player 1'.format(
+            args.games, elapsed, int((winners == 0).sum()), int((winners == 1).sum())))
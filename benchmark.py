@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# benchmark.py
+# Version: October 17, 2026
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import kingandassassins as ka
+
+
+def _state(people, card=(1, 6, True, 5), assassins=('monk',), king='healthy'):
+    '''Build a state with the specified people, placed as {(x, y): name}.'''
+    grid = [[None] * 10 for i in range(10)]
+    for (x, y), name in people.items():
+        grid[x][y] = name
+    visible = dict(ka.KA_INITIAL_STATE, people=grid, card=card, king=king)
+    return ka.KingAndAssassinsState(visible, {'assassins': set(assassins), 'cards': list(ka.CARDS)})
+
+
+def _update(state, moves, player):
+    def run():
+        s = state.copy()
+        s.update(moves, player)
+    return run
+
+
+def _initial(seed):
+    server = ka.KingAndAssassinsServer(seed=seed)
+    state = server._state
+    villagers = [state.people[x][y] for x, y in sorted(ka.VILLAGERS)]
+    server.applymove(json.dumps({'assassins': villagers[:3]}))
+    return server
+
+
+def _randomgame(seed):
+    rng = random.Random(seed)
+    state = _initial(seed)._state
+    while state.winner() == -1:
+        choices = state.choices()
+        # End the turn one time out of four to keep games of realistic length
+        action = None if rng.random() < 0.25 else rng.choice(choices)
+        state.play(action)
+    return state
+
+
+def benchmarks(seed):
+    '''Build the benchmarks, as a dictionary name -> (callable, ops per call).'''
+    rng = random.Random(seed)
+    server = _initial(seed)
+    state = server._state
+    king = {(9, 9): 'king'}
+    result = {
+        'copy': (state.copy, 1),
+        'update.move.king': (_update(_state(dict(king)), [('move', 9, 9, 'W')], 1), 1),
+        'update.move.villager': (_update(_state({(5, 2): 'monk', **king}), [('move', 5, 2, 'E')], 0), 1),
+        'update.move.push1': (_update(_state({(5, 1): 'knight', (5, 2): 'monk', **king}), [('move', 5, 1, 'E')], 1), 1),
+        'update.move.push4': (_update(_state({(5, 0): 'knight', (5, 1): 'monk', (5, 2): 'farmer',
+                                               (5, 3): 'butcher', (5, 4): 'squire', **king}),
+                                       [('move', 5, 0, 'E')], 1), 1),
+        'update.arrest': (_update(_state({(5, 1): 'knight', (5, 2): 'monk', **king}), [('arrest', 5, 1, 'E')], 1), 1),
+        'update.kill.byknight': (_update(_state({(5, 1): 'knight', (5, 2): 'assassin', **king}), [('kill', 5, 1, 'E')], 1), 1),
+        'update.kill.byassassin': (_update(_state({(5, 1): 'knight', (5, 2): 'assassin', **king}), [('kill', 5, 2, 'W')], 0), 1),
+        'update.attack': (_update(_state({(9, 8): 'assassin', **king}), [('attack', 9, 8, 'E')], 0), 1),
+        'update.reveal': (_update(_state({(5, 2): 'monk', **king}), [('reveal', 5, 2)], 0), 1),
+        'winner': (state.winner, 1),
+        'parse+str': (lambda: str(ka.KingAndAssassinsState.parse(str(state))), 1),
+        'server.state': (lambda: server.state, 1),
+        'moves.first1000': (lambda: sum(1 for i, m in zip(range(1000), state.moves(state.player))), 1000),
+        'game.random': (lambda: _randomgame(rng.getrandbits(32)), 1)
+    }
+    return result
+
+
+def measure(function, ops, seconds, repeats):
+    '''Time 'function' and measure its peak memory.
+
+    Pre: 'seconds' > 0, 'repeats' >= 1
+    Post: The returned value is a dictionary with per-operation timings in
+          microseconds (min, median, mean over the repeats), the number of
+          operations timed and the peak of traced memory of one call.
+    '''
+    # Calibrate the number of calls per repeat
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for i in range(number):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds / repeats / 10 or number >= 1 << 20:
+            break
+        number *= 2
+    number = max(1, int(number * (seconds / repeats) / max(elapsed, 1e-9)))
+    timings = []
+    for r in range(repeats):
+        start = time.perf_counter()
+        for i in range(number):
+            function()
+        timings.append((time.perf_counter() - start) / (number * ops) * 1e6)
+    tracemalloc.start()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    function()
+    peak = tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    return {
+        'ops': number * ops * repeats,
+        'min_us': min(timings),
+        'median_us': statistics.median(timings),
+        'mean_us': statistics.mean(timings),
+        'peak_bytes': max(0, peak)
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='King & Assassins benchmarks')
+    parser.add_argument('--seed', help='seed of the inputs (default: 0)', type=int, default=0)
+    parser.add_argument('--seconds', help='time spent per benchmark (default: 1)', type=float, default=1.0)
+    parser.add_argument('--repeats', help='repeats per benchmark (default: 5)', type=int, default=5)
+    parser.add_argument('--filter', help='only run the benchmarks whose name contains this string')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='compare with the results of a previous --output file')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline = json.load(file)['results']
+    results = {}
+    suite = benchmarks(args.seed)
+    for name, (function, ops) in suite.items():
+        if args.filter is not None and args.filter not in name:
+            continue
+        results[name] = measure(function, ops, args.seconds, args.repeats)
+        line = '{:<24} {:>12.2f} us/op {:>10} B peak'.format(name, results[name]['median_us'],
+                                                               results[name]['peak_bytes'])
+        if name in baseline:
+            line += '   x{:.2f}'.format(results[name]['median_us'] / baseline[name]['median_us'])
+        print(line)
+    report = {
+        'meta': {
+            'commit': _commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'seconds': args.seconds,
+            'repeats': args.repeats
+        },
+        'results': results
+    }
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2, sort_keys=True)
@@ -4,13 +4,24 @@
 # Version: April 29, 2016
 
 import argparse
+import base64
+import bisect
+import copy
+import functools
+import importlib
+import itertools
 import json
 import random
 import socket
+import struct
 
-import sys
-
+from lib import clock
 from lib import game
+from lib import mcts
+from lib import record
+from lib import search
+from lib import selfplay
+from lib import tournament
 BUFFER_SIZE = 2048
 
 CARDS = (
@@ -32,6 +43,9 @@ CARDS = (
     (1, 5, False, 4)
 )
 
+# Action points spent by each kind of action (revealing an assassin is free)
+APCOSTS = {'move': 1, 'arrest': 1, 'kill': 1, 'attack': 1, 'reveal': 0}
+
 POPULATION = {
     'monk', 'plumwoman', 'appleman', 'hooker', 'fishwoman', 'butcher',
     'blacksmith', 'shepherd', 'squire', 'carpenter', 'witchhunter', 'farmer'
@@ -70,9 +84,84 @@ for coord in KNIGHTS:
 # Place the villagers on the board
 # random.sample(A, len(A)) returns a list where the elements are shuffled
 # this randomizes the position of the villagers
-for villager, coord in zip(random.sample(POPULATION, len(POPULATION)), VILLAGERS):
+for villager, coord in zip(random.sample(sorted(POPULATION), len(POPULATION)), VILLAGERS):
     PEOPLE[coord[0]][coord[1]] = villager
 
+# Codes of the pawns in the compact representation of the people
+EMPTY, KING, KNIGHT, ASSASSIN = range(4)
+FIRSTVILLAGER = 4
+PAWNS = (None, 'king', 'knight', 'assassin') + tuple(sorted(POPULATION))
+CODES = {name: code for code, name in enumerate(PAWNS) if name is not None}
+
+# Classes of pawns with an occupancy bitmask (bit 10 * x + y for cell (x, y))
+CLASSES = ('king', 'knight', 'assassin', 'villager')
+CLASSOF = bytes([0, 0, 1, 2] + [3] * len(POPULATION))
+
+# The possible triples of assassins, as bitmasks of villagers (bit code - FIRSTVILLAGER)
+TRIPLES = tuple(sum(1 << k for k in triple) for triple in itertools.combinations(range(len(POPULATION)), 3))
+# The villagers of the triples: MEMBERS[t] are the villagers of TRIPLES[t]
+MEMBERS = tuple(itertools.combinations(range(len(POPULATION)), 3))
+
+# Bitmask of the roof cells
+ROOF = sum(1 << (10 * x + y) for x in range(10) for y in range(10) if BOARD[x][y] == 'R')
+
+# Board geometry, computed once: the neighbour of every cell in every
+# direction (OFFBOARD outside of the board), the on-board neighbours as
+# (direction, cell) pairs and the cells from a cell to the edge of the
+# board in every direction (rays followed by the pushes)
+DIRECTIONS = {
+    'E': (0, 1),
+    'W': (0, -1),
+    'S': (1, 0),
+    'N': (-1, 0)
+}
+OFFBOARD = None
+
+
+def _ray(i, d):
+    x, y = divmod(i, 10)
+    dx, dy = DIRECTIONS[d]
+    result = []
+    while 0 <= x + dx <= 9 and 0 <= y + dy <= 9:
+        x, y = x + dx, y + dy
+        result.append(10 * x + y)
+    return tuple(result)
+
+
+RAYS = tuple({d: _ray(i, d) for d in DIRECTIONS} for i in range(100))
+NEIGHBOURS = tuple({d: ray[0] if ray else OFFBOARD for d, ray in RAYS[i].items()} for i in range(100))
+ADJACENT = tuple(tuple((d, ray[0]) for d, ray in RAYS[i].items() if ray) for i in range(100))
+
+# Binary wire format: packed cells, flags, card index and number of arrested
+KINGSTATUS = ('healthy', 'injured', 'dead')
+BINARY = struct.Struct('!50sBBB')
+
+
+def _bits(mask):
+    '''Generate the indices of the bits set in the specified mask.'''
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+# Zobrist keys: one per (cell, pawn code), king status, killed counter value,
+# arrested villager, distinct card, remaining action points and side to move,
+# and one per villager that is a hidden assassin (see hiddenzobrist)
+_zobrist = random.Random(0x4b41)
+ZOBRIST_PEOPLE = tuple(tuple(_zobrist.getrandbits(64) if code else 0 for code in range(len(PAWNS))) for i in range(100))
+ZOBRIST_KING = {status: _zobrist.getrandbits(64) for status in KINGSTATUS}
+ZOBRIST_KILLED = {
+    'knights': tuple(_zobrist.getrandbits(64) for n in range(len(KNIGHTS) + 1)),
+    'assassins': tuple(_zobrist.getrandbits(64) for n in range(4))
+}
+ZOBRIST_ARRESTED = {name: _zobrist.getrandbits(64) for name in PAWNS[FIRSTVILLAGER:]}
+ZOBRIST_CARD = {card: _zobrist.getrandbits(64) for card in sorted(set(CARDS))}
+ZOBRIST_AP = tuple(tuple(_zobrist.getrandbits(64) for n in range(8)) for k in range(2))
+ZOBRIST_PLAYER = _zobrist.getrandbits(64)
+ZOBRIST_ASSASSIN = {name: _zobrist.getrandbits(64) for name in PAWNS[FIRSTVILLAGER:]}
+del _zobrist
+
 KA_INITIAL_STATE = {
     'board': BOARD,
     'people': PEOPLE,
@@ -87,159 +176,787 @@ KA_INITIAL_STATE = {
     }
 }
 
+# Cells the king must reach to enter the castle, and their bitmask
+DOORS = tuple(NEIGHBOURS[10 * x + y][d] for x, y, d in KA_INITIAL_STATE['castle'])
+DOORMASK = sum(1 << i for i in DOORS)
+
+# Distance of the cells that cannot reach the doors
+UNREACHABLE = 255
+
+
+def _doordistances(blocked):
+    # Breadth-first search from the doors, avoiding the roofs and the blocked cells
+    distances = bytearray([UNREACHABLE]) * 100
+    forbidden = ROOF | blocked
+    frontier = [i for i in DOORS if not forbidden >> i & 1]
+    for i in frontier:
+        distances[i] = 0
+    while frontier:
+        following = []
+        for i in frontier:
+            for d, j in ADJACENT[i]:
+                if distances[j] == UNREACHABLE and not forbidden >> j & 1:
+                    distances[j] = distances[i] + 1
+                    following.append(j)
+        frontier = following
+    return bytes(distances)
+
+
+# Number of king moves from every cell to the nearest door, on an empty board
+DOORDISTANCES = _doordistances(0)
+
+
+@functools.lru_cache(maxsize=1 << 14)
+def doordistances(blocked):
+    '''Get the number of king moves from every cell to the nearest door.
+
+    Pre: 'blocked' is the bitmask of the cells the king cannot cross
+    Post: The returned value is a bytes object of 100 distances, indexed by
+          cell, UNREACHABLE for the cells from which no door can be reached.
+          The results are cached by 'blocked'.
+    '''
+    return _doordistances(blocked)
+
+
+def initialstate(rng):
+    '''Build an initial state with the villagers shuffled by 'rng'.
+
+    Pre: 'rng' is a random.Random instance
+    Post: The returned value is a copy of KA_INITIAL_STATE whose villagers
+          have been placed according to 'rng'.
+    '''
+    people = [[None if p in POPULATION else p for p in row] for row in PEOPLE]
+    for villager, coord in zip(rng.sample(sorted(POPULATION), len(POPULATION)), sorted(VILLAGERS)):
+        people[coord[0]][coord[1]] = villager
+    return dict(KA_INITIAL_STATE, people=people)
+
 
 class KingAndAssassinsState(game.GameState):
-    '''Class representing a state for the King & Assassins game.'''
+    '''Class representing a state for the King & Assassins game.
+
+    The people are stored in a flat bytearray of 100 cells containing the
+    codes of the pawns (see PAWNS), completed with one occupancy bitmask per
+    class of pawns. The nested lists of names only exist at the wire boundary.
+
+    Every change is recorded in an undo journal, so that actions can be
+    played in place with play() and exactly reverted with undo(). A 64-bit
+    Zobrist hash of the position is maintained incrementally alongside.
+    '''
+
+    DIRECTIONS = DIRECTIONS
+
+    def __init__(self, initialstate=KA_INITIAL_STATE, hidden=None):
+        visible = {key: value for key, value in initialstate.items() if key != 'people'}
+        visible['arrested'] = list(visible['arrested'])
+        visible['killed'] = dict(visible['killed'])
+        people = bytes(EMPTY if p is None else CODES[p] for row in initialstate['people'] for p in row)
+        self._load(visible, hidden, people)
+
+    def _load(self, visible, hidden, people):
+        # Initialise from a visible dict without people and the 100 cell codes
+        super().__init__(visible, hidden)
+        self._people = bytearray(100)
+        self._masks = [0] * len(CLASSES)
+        self._hash = 0
+        for i in range(100):
+            if people[i]:
+                self._place(i, people[i])
+        # Undo journal: cell changes are encoded as (index << 8 | old code),
+        # the other changes as tuples; marks delimit the played actions
+        self._journal = []
+        self._marks = []
+        self._player = 0
+        self._ap = self.budget(0)
+        self._hash ^= self._scalarhash()
+        self._drawn = None
+        self._belief = None
+
+    def _scalarhash(self):
+        visible = self._state['visible']
+        h = ZOBRIST_KING[visible['king']]
+        h ^= ZOBRIST_KILLED['knights'][visible['killed']['knights']]
+        h ^= ZOBRIST_KILLED['assassins'][visible['killed']['assassins']]
+        for name in visible['arrested']:
+            h ^= ZOBRIST_ARRESTED[name]
+        return h ^ self._turnhash(visible['card'], self._player, self._ap)
+
+    def _turnhash(self, card, player, ap):
+        h = ZOBRIST_PLAYER if player == 1 else 0
+        if card is not None:
+            h ^= ZOBRIST_CARD[tuple(card)]
+        if ap is not None:
+            for k, n in enumerate(ap):
+                h ^= ZOBRIST_AP[k][n]
+        return h
+
+    def _place(self, i, code):
+        people = self._people
+        old = people[i]
+        if old:
+            self._masks[CLASSOF[old]] &= ~(1 << i)
+        people[i] = code
+        if code:
+            self._masks[CLASSOF[code]] |= 1 << i
+        self._hash ^= ZOBRIST_PEOPLE[i][old] ^ ZOBRIST_PEOPLE[i][code]
+
+    def _setking(self, status):
+        visible = self._state['visible']
+        self._hash ^= ZOBRIST_KING[visible['king']] ^ ZOBRIST_KING[status]
+        visible['king'] = status
 
-    DIRECTIONS = {
-        'E': (0, 1),
-        'W': (0, -1),
-        'S': (1, 0),
-        'N': (-1, 0)
-    }
+    def _addkilled(self, key, n):
+        killed = self._state['visible']['killed']
+        self._hash ^= ZOBRIST_KILLED[key][killed[key]] ^ ZOBRIST_KILLED[key][killed[key] + n]
+        killed[key] += n
 
-    def __init__(self, initialstate=KA_INITIAL_STATE):
-        super().__init__(initialstate)
+    def _setturn(self, card, player, ap):
+        visible = self._state['visible']
+        self._hash ^= self._turnhash(visible['card'], self._player, self._ap) ^ self._turnhash(card, player, ap)
+        visible['card'] = card
+        self._player = player
+        self._ap = ap
 
-    def _nextfree(self, x, y, d):
-        people = self._state['visible']['people']
-        nx, ny = self._getcoord((x, y, d))
-        ix, iy = nx, ny
-        while 0 <= ix <= 9 and 0 <= iy <= 9 and people[ix][iy] is not None:
-            # Must be a villager
-            if people[ix][iy] not in POPULATION:
-                return None
-            # Cannot be a roof
-            if (ix, iy) != (nx, ny) and BOARD[ix][iy] == 'R':
+    def _set(self, i, code):
+        self._journal.append(i << 8 | self._people[i])
+        self._place(i, code)
+
+    def _rollback(self, length):
+        journal = self._journal
+        visible = self._state['visible']
+        while len(journal) > length:
+            entry = journal.pop()
+            if entry.__class__ is int:
+                self._place(entry >> 8, entry & 0xff)
+            elif entry[0] == 'king':
+                self._setking(entry[1])
+            elif entry[0] == 'killed':
+                self._addkilled(entry[1], -1)
+            elif entry[0] == 'arrested':
+                self._hash ^= ZOBRIST_ARRESTED[visible['arrested'].pop()]
+            elif entry[0] == 'card':
+                self._state['hidden']['cards'].append(visible['card'])
+                self._setturn(entry[1], self._player, self._ap)
+            elif entry[0] == 'turn':
+                self._setturn(visible['card'], entry[1], entry[2])
+            elif entry[0] == 'lastopponentmove':
+                visible['lastopponentmove'] = entry[1]
+
+    def publicstate(self):
+        result = self.copy()
+        result._state['hidden'] = None
+        result._drawn = None
+        result._belief = None
+        return result
+
+    def copy(self):
+        '''Return a copy of this state, sharing only immutable data.'''
+        result = KingAndAssassinsState.__new__(KingAndAssassinsState)
+        visible = dict(self._state['visible'])
+        visible['arrested'] = list(visible['arrested'])
+        visible['killed'] = dict(visible['killed'])
+        hidden = self._state['hidden']
+        if hidden is not None:
+            hidden = dict(hidden)
+            if hidden['assassins'] is not None:
+                hidden['assassins'] = set(hidden['assassins'])
+            if hidden['cards'] is not None:
+                hidden['cards'] = list(hidden['cards'])
+        result._state = {'visible': visible, 'hidden': hidden}
+        result._people = bytearray(self._people)
+        result._masks = list(self._masks)
+        result._journal = []
+        result._marks = []
+        result._player = self._player
+        result._ap = self._ap
+        result._hash = self._hash
+        result._drawn = self._drawn
+        result._belief = self._belief
+        return result
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    @property
+    def people(self):
+        '''The people as a 10x10 list of lists of names (None for empty cells).'''
+        people = self._people
+        return [[PAWNS[people[10 * x + y]] for y in range(10)] for x in range(10)]
+
+    @property
+    def visible(self):
+        '''The visible part of the state, as exchanged with the clients.'''
+        visible = self._state['visible']
+        result = {'board': visible['board'], 'people': self.people}
+        result.update((key, value) for key, value in visible.items() if key != 'board')
+        return result
+
+    def __str__(self):
+        return json.dumps(self.visible, separators=(',', ':'))
+
+    @classmethod
+    def capabilities(cls):
+        return ('delta', 'binary')
+
+    def encode(self):
+        '''Get the visible state in the compact binary format.
+
+        Pre: The board and the castle are the ones of KA_INITIAL_STATE
+        Post: The returned value is a bytes object made of the 100 cell codes
+              packed two per byte, one byte of flags (king's status on bits
+              0-1, killed knights on bits 2-4 and killed assassins on bits
+              5-6), the index of the card in CARDS (255 for None), the number
+              of arrested villagers and their codes, followed by the last
+              opponent's move as UTF-8 JSON.
+        '''
+        visible = self._state['visible']
+        people = self._people
+        cells = bytes(people[i] << 4 | people[i + 1] for i in range(0, 100, 2))
+        killed = visible['killed']
+        flags = KINGSTATUS.index(visible['king']) | killed['knights'] << 2 | killed['assassins'] << 5
+        card = 255 if visible['card'] is None else CARDS.index(tuple(visible['card']))
+        arrested = bytes(CODES[name] for name in visible['arrested'])
+        lastopponentmove = json.dumps(visible['lastopponentmove'], separators=(',', ':')).encode()
+        return BINARY.pack(cells, flags, card, len(arrested)) + arrested + lastopponentmove
+
+    @classmethod
+    def decode(cls, data):
+        '''Build a state from the compact binary format returned by encode().'''
+        cells, flags, card, count = BINARY.unpack_from(data)
+        start = BINARY.size
+        people = bytearray(100)
+        people[0::2] = bytes(c >> 4 for c in cells)
+        people[1::2] = bytes(c & 0xf for c in cells)
+        visible = {
+            'board': BOARD,
+            'castle': KA_INITIAL_STATE['castle'],
+            'card': None if card == 255 else CARDS[card],
+            'king': KINGSTATUS[flags & 0x3],
+            'lastopponentmove': json.loads(bytes(data[start + count:]).decode()),
+            'arrested': [PAWNS[code] for code in data[start:start + count]],
+            'killed': {
+                'knights': flags >> 2 & 0x7,
+                'assassins': flags >> 5 & 0x3
+            }
+        }
+        result = cls.__new__(cls)
+        result._load(visible, None, people)
+        return result
+
+    def snapshot(self):
+        visible = self._state['visible']
+        return (bytes(self._people), visible['card'], visible['king'], dict(visible['killed']),
+                len(visible['arrested']), list(visible['lastopponentmove']))
+
+    def delta(self, snapshot):
+        '''Get the changes since 'snapshot' as a JSON object.
+
+        Pre: 'snapshot' has been returned by snapshot() on this state
+        Post: The returned value contains the changed cells, as a list of
+              [x, y, name], and the changed scalars of the visible state.
+        '''
+        people, card, king, killed, arrested, lastopponentmove = snapshot
+        visible = self._state['visible']
+        current = self._people
+        result = {'cells': [[i // 10, i % 10, PAWNS[current[i]]] for i in range(100) if current[i] != people[i]]}
+        if visible['card'] != card:
+            result['card'] = visible['card']
+        if visible['king'] != king:
+            result['king'] = visible['king']
+        if visible['killed'] != killed:
+            result['killed'] = visible['killed']
+        if len(visible['arrested']) != arrested:
+            result['arrested'] = visible['arrested'][arrested:]
+        if visible['lastopponentmove'] != lastopponentmove:
+            result['lastopponentmove'] = visible['lastopponentmove']
+        return json.dumps(result, separators=(',', ':'))
+
+    def applydelta(self, delta):
+        delta = json.loads(delta)
+        visible = self._state['visible']
+        for x, y, name in delta['cells']:
+            self._place(10 * x + y, CODES[name] if name is not None else EMPTY)
+        if 'king' in delta:
+            self._setking(delta['king'])
+        for key, n in delta.get('killed', {}).items():
+            self._addkilled(key, n - visible['killed'][key])
+        for name in delta.get('arrested', []):
+            visible['arrested'].append(name)
+            self._hash ^= ZOBRIST_ARRESTED[name]
+        if 'lastopponentmove' in delta:
+            visible['lastopponentmove'] = delta['lastopponentmove']
+        if 'card' in delta:
+            self._setturn(delta['card'], self._player, self._ap)
+            self.player = self._player
+        self._journal.clear()
+
+    def _nextfree(self, i, d):
+        # First free cell where a knight in cell i can push villagers in direction d
+        people = self._people
+        for k, j in enumerate(RAYS[i][d]):
+            if not people[j]:
+                return j
+            # Must be a villager, which cannot be pushed from a roof
+            if people[j] < FIRSTVILLAGER or k and ROOF >> j & 1:
                 return None
-            ix, iy = self._getcoord((ix, iy, d))
-        if 0 <= ix <= 9 and 0 <= iy <= 9:
-            return (ix, iy)
         return None
 
-    def update(self, moves, player):
+    def _target(self, move, x, y, d):
+        if not (0 <= x <= 9 and 0 <= y <= 9) or d not in DIRECTIONS:
+            raise game.InvalidMoveException('{}: invalid coordinates or direction'.format(move))
+        t = NEIGHBOURS[10 * x + y][d]
+        if t is OFFBOARD:
+            raise game.InvalidMoveException('{}: the target cell is outside of the board'.format(move))
+        return t
+
+    def _apply(self, move, player):
         visible = self._state['visible']
         hidden = self._state['hidden']
-        people = visible['people']
-        for move in moves:
-            print(move)
-            # ('move', x, y, dir): moves person at position (x,y) of one cell in direction dir
-            if move[0] == 'move':
-                x, y, d = int(move[1]), int(move[2]), move[3]
-                p = people[x][y]
-                if p is None:
-                    raise game.InvalidMoveException('{}: there is no one to move'.format(move))
-                nx, ny = self._getcoord((x, y, d))
-                new = people[nx][ny]
-                # King, assassins, villagers can only move on a free cell
-                if p != 'knight' and new is not None:
-                    raise game.InvalidMoveException('{}: cannot move on a cell that is not free'.format(move))
-                if p == 'king' and BOARD[nx][ny] == 'R':
-                    raise game.InvalidMoveException('{}: the king cannot move on a roof'.format(move))
-                if (p in {'assassin'} or p in POPULATION) and player != 0:
-                    raise game.InvalidMoveException('{}: villagers and assassins can only be moved by player 0'.format(move))
-                if p in {'king', 'knight'} and player != 1:
-                    raise game.InvalidMoveException('{}: the king and knights can only be moved by player 1'.format(move))
-                # Move granted if cell is free
-                if new is None:
-                    people[x][y], people[nx][ny] = people[nx][ny], people[x][y]
-                # If cell is not free, check if the knight can push villagers
-                else:
-                    nf = self._nextfree((x, y, d))
-                    if nf is None:
-                        raise game.InvalidMoveException('{}: cannot move-and-push in the given direction'.format(move))
-                    nfx, nfy = nf
-                    while (nfx, nfy) != (x, y):
-                        px, py = self._getcoord((nfx, nfx, {'E': 'W', 'W': 'E', 'S': 'N', 'N': 'S'}[d]))
-                        people[nfx][nfy] = people[px][py]
-                        nfx, nfy = px, py
-            # ('arrest', x, y, dir): arrests the villager in direction dir with knight at position (x, y)
-            elif move[0] == 'arrest':
-                if player != 1:
-                    raise game.InvalidMoveException('arrest action only possible for player 1')
-                x, y, d = int(move[1]), int(move[2]), move[3]
-                arrester = people[x][y]
-                if arrester != 'knight':
-                    raise game.InvalidMoveException('{}: the attacker is not a knight'.format(move))
-                tx, ty = self._getcoord((x, y, d))
-                target = people[tx][ty]
-                if target not in POPULATION:
-                    raise game.InvalidMoveException('{}: only villagers can be arrested'.format(move))
-                visible['arrested'].append(people[tx][ty])
-                people[tx][ty] = None
-            # ('kill', x, y, dir): kills the assassin/knight in direction dir with knight/assassin at position (x, y)
-            elif move[0] == 'kill':
-                x, y, d = int(move[1]), int(move[2]), move[3]
-                killer = people[x][y]
-                if killer == 'assassin' and player != 0:
-                    raise game.InvalidMoveException('{}: kill action for assassin only possible for player 0'.format(move))
-                if killer == 'knight' and player != 1:
-                    raise game.InvalidMoveException('{}: kill action for knight only possible for player 1'.format(move))
-                tx, ty = self._getcoord((x, y, d))
-                target = people[tx][ty]
-                if target is None:
-                    raise game.InvalidMoveException('{}: there is no one to kill'.format(move))
-                if killer == 'assassin' and target == 'knight':
-                    visible['killed']['knights'] += 1
-                    people[tx][ty] = None
-                elif killer == 'knight' and target == 'assassin':
-                    visible['killed']['assassins'] += 1
-                    people[tx][ty] = None
-                else:
-                    raise game.InvalidMoveException('{}: forbidden kill'.format(move))
-            # ('attack', x, y, dir): attacks the king in direction dir with assassin at position (x, y)
-            elif move[0] == 'attack':
-                if player != 0:
-                    raise game.InvalidMoveException('attack action only possible for player 0')
-                x, y, d = int(move[1]), int(move[2]), move[3]
-                attacker = people[x][y]
-                if attacker != 'assassin':
-                    raise game.InvalidMoveException('{}: the attacker is not an assassin'.format(move))
-                tx, ty = self._getcoord((x, y, d))
-                target = people[tx][ty]
-                if target != 'king':
-                    raise game.InvalidMoveException('{}: only the king can be attacked'.format(move))
-                visible['king'] = 'injured' if visible['king'] == 'healthy' else 'dead'
-            # ('reveal', x, y): reveals villager at position (x,y) as an assassin
-            elif move[0] == 'reveal':
-                if player != 0:
-                    raise game.InvalidMoveException('raise action only possible for player 0')
-                x, y = int(move[1]), int(move[2])
-                p = people[x][y]
-                if p not in hidden['assassins']:
-                    raise game.InvalidMoveException('{}: the specified villager is not an assassin'.format(move))
-                people[x][y] = 'assassin'
+        people = self._people
+        # ('move', x, y, dir): moves person at position (x,y) of one cell in direction dir
+        if move[0] == 'move':
+            x, y, d = int(move[1]), int(move[2]), move[3]
+            t = self._target(move, x, y, d)
+            i = 10 * x + y
+            p = people[i]
+            if p == EMPTY:
+                raise game.InvalidMoveException('{}: there is no one to move'.format(move))
+            new = people[t]
+            # King, assassins, villagers can only move on a free cell
+            if p != KNIGHT and new != EMPTY:
+                raise game.InvalidMoveException('{}: cannot move on a cell that is not free'.format(move))
+            if p == KING and ROOF >> t & 1:
+                raise game.InvalidMoveException('{}: the king cannot move on a roof'.format(move))
+            if p >= ASSASSIN and player != 0:
+                raise game.InvalidMoveException('{}: villagers and assassins can only be moved by player 0'.format(move))
+            if p <= KNIGHT and player != 1:
+                raise game.InvalidMoveException('{}: the king and knights can only be moved by player 1'.format(move))
+            # Move granted if cell is free
+            if new == EMPTY:
+                self._set(t, p)
+                self._set(i, EMPTY)
+            # If cell is not free, check if the knight can push villagers
+            else:
+                j = self._nextfree(i, d)
+                if j is None:
+                    raise game.InvalidMoveException('{}: cannot move-and-push in the given direction'.format(move))
+                step = t - i
+                while j != i:
+                    self._set(j, people[j - step])
+                    j -= step
+                self._set(i, EMPTY)
+        # ('arrest', x, y, dir): arrests the villager in direction dir with knight at position (x, y)
+        elif move[0] == 'arrest':
+            if player != 1:
+                raise game.InvalidMoveException('arrest action only possible for player 1')
+            x, y, d = int(move[1]), int(move[2]), move[3]
+            t = self._target(move, x, y, d)
+            if people[10 * x + y] != KNIGHT:
+                raise game.InvalidMoveException('{}: the attacker is not a knight'.format(move))
+            if people[t] < FIRSTVILLAGER:
+                raise game.InvalidMoveException('{}: only villagers can be arrested'.format(move))
+            visible['arrested'].append(PAWNS[people[t]])
+            self._hash ^= ZOBRIST_ARRESTED[PAWNS[people[t]]]
+            self._journal.append(('arrested',))
+            self._set(t, EMPTY)
+        # ('kill', x, y, dir): kills the assassin/knight in direction dir with knight/assassin at position (x, y)
+        elif move[0] == 'kill':
+            x, y, d = int(move[1]), int(move[2]), move[3]
+            t = self._target(move, x, y, d)
+            killer = people[10 * x + y]
+            if killer == ASSASSIN and player != 0:
+                raise game.InvalidMoveException('{}: kill action for assassin only possible for player 0'.format(move))
+            if killer == KNIGHT and player != 1:
+                raise game.InvalidMoveException('{}: kill action for knight only possible for player 1'.format(move))
+            target = people[t]
+            if target == EMPTY:
+                raise game.InvalidMoveException('{}: there is no one to kill'.format(move))
+            if killer == ASSASSIN and target == KNIGHT:
+                self._addkilled('knights', 1)
+                self._journal.append(('killed', 'knights'))
+                self._set(t, EMPTY)
+            elif killer == KNIGHT and target == ASSASSIN:
+                self._addkilled('assassins', 1)
+                self._journal.append(('killed', 'assassins'))
+                self._set(t, EMPTY)
+            else:
+                raise game.InvalidMoveException('{}: forbidden kill'.format(move))
+        # ('attack', x, y, dir): attacks the king in direction dir with assassin at position (x, y)
+        elif move[0] == 'attack':
+            if player != 0:
+                raise game.InvalidMoveException('attack action only possible for player 0')
+            x, y, d = int(move[1]), int(move[2]), move[3]
+            t = self._target(move, x, y, d)
+            if people[10 * x + y] != ASSASSIN:
+                raise game.InvalidMoveException('{}: the attacker is not an assassin'.format(move))
+            if people[t] != KING:
+                raise game.InvalidMoveException('{}: only the king can be attacked'.format(move))
+            self._journal.append(('king', visible['king']))
+            self._setking('injured' if visible['king'] == 'healthy' else 'dead')
+        # ('reveal', x, y): reveals villager at position (x,y) as an assassin
+        elif move[0] == 'reveal':
+            if player != 0:
+                raise game.InvalidMoveException('raise action only possible for player 0')
+            x, y = int(move[1]), int(move[2])
+            if not (0 <= x <= 9 and 0 <= y <= 9):
+                raise game.InvalidMoveException('{}: invalid coordinates'.format(move))
+            p = PAWNS[people[10 * x + y]]
+            if p not in hidden['assassins']:
+                raise game.InvalidMoveException('{}: the specified villager is not an assassin'.format(move))
+            self._set(10 * x + y, ASSASSIN)
+        else:
+            raise game.InvalidMoveException('{}: unknown action'.format(move))
+
+    def budget(self, player):
+        '''Get the action points of the current card for the specified player.
+
+        Pre: 'player' is 0 or 1
+        Post: The returned value is a tuple (AP King, AP Knights) for player 1,
+              or a tuple (AP Population/Assassins,) for player 0, and None
+              if no card has been drawn yet.
+        '''
+        card = self._state['visible']['card']
+        if card is None:
+            return None
+        return (card[0], card[1]) if player == 1 else (card[3],)
+
+    def actions(self, player, ap):
+        '''Generate the single legal actions for a player.
+
+        Pre: 'ap' is the remaining action points, as returned by budget()
+        Post: Pairs (action, remaining action points) have been generated
+              for every action the specified 'player' may play next.
+        '''
+        people = self._people
+        masks = self._masks
+        if player == 1:
+            if ap[0] >= APCOSTS['move']:
+                for i in _bits(masks[CLASSOF[KING]]):
+                    x, y = divmod(i, 10)
+                    for d, t in ADJACENT[i]:
+                        if not people[t] and not ROOF >> t & 1:
+                            yield ('move', x, y, d), (ap[0] - APCOSTS['move'], ap[1])
+            for i in _bits(masks[CLASSOF[KNIGHT]]):
+                x, y = divmod(i, 10)
+                for d, t in ADJACENT[i]:
+                    target = people[t]
+                    if ap[1] >= APCOSTS['move'] and (not target or self._nextfree(i, d) is not None):
+                        yield ('move', x, y, d), (ap[0], ap[1] - APCOSTS['move'])
+                    if ap[1] >= APCOSTS['arrest'] and target >= FIRSTVILLAGER:
+                        yield ('arrest', x, y, d), (ap[0], ap[1] - APCOSTS['arrest'])
+                    if ap[1] >= APCOSTS['kill'] and target == ASSASSIN:
+                        yield ('kill', x, y, d), (ap[0], ap[1] - APCOSTS['kill'])
+        else:
+            hidden = self._state['hidden']
+            assassins = hidden['assassins'] if hidden is not None else None
+            if assassins:
+                for i in _bits(masks[CLASSOF[FIRSTVILLAGER]]):
+                    if PAWNS[people[i]] in assassins:
+                        yield ('reveal', *divmod(i, 10)), (ap[0] - APCOSTS['reveal'],)
+            for i in _bits(masks[CLASSOF[ASSASSIN]] | masks[CLASSOF[FIRSTVILLAGER]]):
+                x, y = divmod(i, 10)
+                for d, t in ADJACENT[i]:
+                    target = people[t]
+                    if ap[0] >= APCOSTS['move'] and not target:
+                        yield ('move', x, y, d), (ap[0] - APCOSTS['move'],)
+                    if people[i] == ASSASSIN:
+                        if ap[0] >= APCOSTS['kill'] and target == KNIGHT:
+                            yield ('kill', x, y, d), (ap[0] - APCOSTS['kill'],)
+                        if ap[0] >= APCOSTS['attack'] and target == KING:
+                            yield ('attack', x, y, d), (ap[0] - APCOSTS['attack'],)
+
+    def choices(self):
+        '''Get the choices of the player whose turn it is, for searching.
+
+        Pre: -
+        Post: The returned value is the list of the legal single actions of
+              the player to move, captures first, followed by None to end
+              the turn. It is empty if no card has been drawn yet.
+        '''
+        if self._ap is None:
+            return []
+        captures, others = [], []
+        for action, left in self.actions(self._player, self._ap):
+            (others if action[0] == 'move' else captures).append(action)
+        return captures + others + [None]
+
+    def moves(self, player):
+        '''Generate the legal sequences of actions for a player.
+
+        Pre: 'player' is 0 or 1
+        Post: Every sequence of actions that the specified 'player' may play
+              with the action points of the current card has been generated,
+              starting with the empty sequence. The generation is lazy and
+              depth-first, so that the caller can stop it at any time.
+              The state is unchanged whenever a sequence is yielded, so that
+              the caller may copy it, or play and undo actions on it, as long
+              as it restores the state before asking for the next sequence.
+        '''
+        ap = self.budget(player)
+        if ap is None:
+            return
+        base = len(self._journal)
+        stack = [([], ap)]
+        while stack:
+            prefix, left = stack.pop()
+            yield prefix
+            # Replay the sequence to find its extensions, then restore the state
+            try:
+                for action in prefix:
+                    self._apply(action, player)
+                following = [(prefix + [action], rest) for action, rest in self.actions(player, left)]
+            finally:
+                self._rollback(base)
+            stack.extend(reversed(following))
+
+    @property
+    def player(self):
+        '''The player whose turn it is.'''
+        return self._player
+
+    @player.setter
+    def player(self, player):
+        self._setturn(self._state['visible']['card'], player, self.budget(player))
+
+    @property
+    def zobrist(self):
+        '''The 64-bit Zobrist hash of this state.
+
+        It covers the people, the king's status, the killed counters, the
+        arrested villagers, the current card, the side to move and its
+        remaining action points, but none of the hidden information.
+        '''
+        return self._hash
+
+    @property
+    def hiddenzobrist(self):
+        '''The 64-bit Zobrist hash of the hidden assassins of this state.
+
+        It is 0 if they are unknown. It does not change with play() and
+        undo(), and tells apart the determinizations (see determinize())
+        that share the same visible position.
+        '''
+        hidden = self._state['hidden']
+        h = 0
+        if hidden is not None and hidden['assassins'] is not None:
+            for name in hidden['assassins']:
+                h ^= ZOBRIST_ASSASSIN[name]
+        return h
+
+    @property
+    def ap(self):
+        '''The action points left to the player whose turn it is.'''
+        return self._ap
+
+    def _spend(self, action, player, ap):
+        if action[0] not in APCOSTS:
+            raise game.InvalidMoveException('{}: unknown action'.format(action))
+        if ap is None:
+            raise game.InvalidMoveException('{}: no card has been drawn yet'.format(action))
+        cost = APCOSTS[action[0]]
+        # The king spends its own action points, the knights spend the others
+        x, y = int(action[1]), int(action[2])
+        k = 1 if player == 1 and not (0 <= x <= 9 and 0 <= y <= 9 and self._people[10 * x + y] == KING) else 0
+        if ap[k] < cost:
+            raise game.InvalidMoveException('{}: not enough action points'.format(action))
+        return ap[:k] + (ap[k] - cost,) + ap[k + 1:]
+
+    def play(self, action):
+        '''Play one action in place for the player whose turn it is.
+
+        Pre: 'action' is an action tuple, or None to end the turn
+        Post: The action has been applied and recorded in the undo journal,
+              spending the action points of the player. Ending the turn of
+              player 0 draws a new card if the deck is known.
+        Raises InvalidMoveException: If 'action' is invalid, in which case
+              the state is left unchanged.
+        '''
+        mark = len(self._journal)
+        self._marks.append(mark)
+        try:
+            self._journal.append(('turn', self._player, self._ap))
+            if action is None:
+                hidden = self._state['hidden']
+                if self._player == 0 and hidden is not None and hidden['cards']:
+                    visible = self._state['visible']
+                    self._journal.append(('card', visible['card']))
+                    self._setturn(hidden['cards'].pop(), self._player, self._ap)
+                self.player = 1 - self._player
+            else:
+                self._setturn(self._state['visible']['card'], self._player, self._spend(action, self._player, self._ap))
+                self._apply(action, self._player)
+        except game.InvalidMoveException:
+            self._rollback(self._marks.pop())
+            raise
+
+    def undo(self):
+        '''Undo the last action played with play().
+
+        Pre: At least one action has been played and not undone
+        Post: The state is exactly the one before that action.
+        '''
+        self._rollback(self._marks.pop())
+
+    def update(self, moves, player):
+        '''Apply the whole turn of a player, atomically.
+
+        Pre: 'moves' is a list of actions, 'player' is 0 or 1
+        Post: Every action has been checked against the rules and against
+              the action points of the current card, on top of the previous
+              ones, and the turn has been passed to the other player.
+        Raises InvalidMoveException: If an action is invalid, in which case
+              the state is left unchanged. Any other error raised by a
+              malformed action leaves the state unchanged as well.
+        '''
+        mark = len(self._journal)
+        try:
+            ap = self.budget(player)
+            for move in moves:
+                if ap is not None:
+                    ap = self._spend(move, player, ap)
+                self._apply(move, player)
+        except Exception:
+            self._rollback(mark)
+            raise
+        # The other player will see these moves
+        visible = self._state['visible']
+        self._journal.append(('lastopponentmove', visible['lastopponentmove']))
+        visible['lastopponentmove'] = [list(move) for move in moves]
         # If assassins' team just played, draw a new card
         if player == 0:
-            visible['card'] = hidden['cards'].pop()
-
-    def _getcoord(self, coord):
-        return tuple(coord[i] + KingAndAssassinsState.DIRECTIONS[coord[2]][i] for i in range(2))
+            self._setturn(self._state['hidden']['cards'].pop(), self._player, self._ap)
+        self.player = 1 - player
+        if not self._marks:
+            self._journal.clear()
 
     def winner(self):
         visible = self._state['visible']
         hidden = self._state['hidden']
         # The king reached the castle
-        for doors in visible['castle']:
-            coord = self._getcoord(doors)
-            if visible['people'][coord[0]][coord[1]] == 'king':
-                return 1
-        # The are no more cards
-        if len(hidden['cards']) == 0:
+        if self._masks[CLASSOF[KING]] & DOORMASK:
+            return 1
+        # The are no more cards (the clients do not know the deck)
+        if hidden is not None and hidden['cards'] is not None and len(hidden['cards']) == 0:
             return 0
         # The king has been killed
         if visible['king'] == 'dead':
             return 0
 
         # All the assassins have been arrested or killed
-        if visible['killed']['assassins'] + len(set(visible['arrested']) & hidden['assassins']) == 3:
+        assassins = hidden['assassins'] if hidden is not None and hidden['assassins'] is not None else set()
+        if visible['killed']['assassins'] + len(set(visible['arrested']) & assassins) == 3:
             return 1
         return -1
 
+    def evaluate(self, player):
+        '''Evaluate this state heuristically.
+
+        Pre: 'player' is 0 or 1
+        Post: The returned value is a score from the point of view of the
+              specified 'player', the higher the better.
+        '''
+        visible = self._state['visible']
+        masks = self._masks
+        king = masks[CLASSOF[KING]].bit_length() - 1
+        # Path to the doors around the roofs and the other pawns, if any
+        occupied = masks[0] | masks[1] | masks[2] | masks[3]
+        distance = doordistances(occupied & ~(1 << king))[king]
+        if distance == UNREACHABLE:
+            distance = DOORDISTANCES[king] + 5
+        score = -10 * distance
+        score -= {'healthy': 0, 'injured': 40, 'dead': 1000}[visible['king']]
+        score += 15 * bin(masks[CLASSOF[KNIGHT]]).count('1')
+        score += 60 * visible['killed']['assassins'] + 20 * len(visible['arrested'])
+        # Revealed assassins next to the king threaten it
+        for d, i in ADJACENT[king]:
+            if self._people[i] == ASSASSIN:
+                score -= 50
+        return score if player == 1 else -score
+
+    def setdrawn(self, cards):
+        '''Set the cards that have been drawn so far, the current one included.
+
+        Pre: 'cards' is a list of cards of CARDS, in the order they were drawn
+        Post: The cards are used by determinize() to rebuild the deck.
+        '''
+        self._drawn = [tuple(card) for card in cards]
+
+    def setbelief(self, belief):
+        '''Set the beliefs about the assassins, used by determinize().
+
+        Pre: 'belief' is an AssassinBelief updated with this state, or None
+        '''
+        self._belief = belief
+
+    def remaining(self):
+        '''Get the cards that may still be drawn.
+
+        Pre: -
+        Post: The returned value is a new list with the cards of the deck if
+              it is known, or else the cards of CARDS that have not been
+              drawn yet (see setdrawn()), in no particular order.
+        '''
+        hidden = self._state['hidden']
+        if hidden is not None and hidden['cards'] is not None:
+            return list(hidden['cards'])
+        cards = list(CARDS)
+        drawn = self._drawn if self._drawn is not None else [self._state['visible']['card']]
+        for card in drawn:
+            if card is not None and tuple(card) in cards:
+                cards.remove(tuple(card))
+        return cards
+
+    def draw(self, card):
+        '''End the turn of player 0 with a chosen card as the next one, for searching.
+
+        Pre: The player to move is 0, the deck is known and contains 'card'
+        Post: The turn has been ended as with play(None), drawing 'card'. It
+              is undone with undo(), which puts the card back in the deck.
+        '''
+        cards = self._state['hidden']['cards']
+        # The order of the deck does not matter once the next card is chosen
+        i = cards.index(card)
+        cards[i], cards[-1] = cards[-1], cards[i]
+        self.play(None)
+
+    def determinize(self, rng):
+        '''Sample the hidden part of this state.
+
+        Pre: 'rng' is a random.Random instance
+        Post: The returned value is a copy of this state where the unknown
+              assassins are sampled among the villagers that have not been
+              revealed (arrested ones included), without ending the game,
+              according to the beliefs if set (see setbelief()), and the
+              unknown deck is a shuffle of the cards not drawn yet. Known
+              hidden information is kept as is.
+        '''
+        result = self.copy()
+        visible = self._state['visible']
+        hidden = result._state['hidden'] or {'assassins': None, 'cards': None}
+        if hidden['assassins'] is None and self._belief is not None:
+            hidden['assassins'] = self._belief.sample(rng)
+        elif hidden['assassins'] is None:
+            masks = self._masks
+            count = 3 - visible['killed']['assassins'] - bin(masks[CLASSOF[ASSASSIN]]).count('1')
+            candidates = [PAWNS[self._people[i]] for i in _bits(masks[CLASSOF[FIRSTVILLAGER]])] + visible['arrested']
+            arrested = set(visible['arrested'])
+            while True:
+                assassins = set(rng.sample(candidates, max(0, min(count, len(candidates)))))
+                if count <= 0 or visible['killed']['assassins'] + len(assassins & arrested) < 3:
+                    break
+            hidden['assassins'] = assassins
+        if hidden['cards'] is None:
+            cards = self.remaining()
+            rng.shuffle(cards)
+            hidden['cards'] = cards
+        result._state['hidden'] = hidden
+        return result
+
     def isinitial(self):
         return self._state['hidden']['assassins'] is None
 
     def setassassins(self, assassins):
+        if self._state['hidden'] is None:
+            self._state['hidden'] = {'assassins': None, 'cards': None}
         self._state['hidden']['assassins'] = set(assassins)
 
     def prettyprint(self):
@@ -253,8 +970,8 @@ class KingAndAssassinsState(game.GameState):
         result += '   - King: {}\n'.format(visible['king'])
         result += '   - People:\n'
         result += '   +{}\n'.format('----+' * 10)
-        for i in range(10):
-            result += '   | {} |\n'.format(' | '.join(['  ' if e is None else e[0:2] for e in visible['people'][i]]))
+        for i, row in enumerate(self.people):
+            result += '   | {} |\n'.format(' | '.join(['  ' if e is None else e[0:2] for e in row]))
             result += '   +{}\n'.format(''.join(['----+' if e == 'G' else '^^^^+' for e in visible['board'][i]]))
         print(result)
 
@@ -263,15 +980,178 @@ class KingAndAssassinsState(game.GameState):
         return BUFFER_SIZE
 
 
+class AssassinBelief:
+    '''Class representing the beliefs of player 1 about the assassins.
+
+    A weight is kept for each of the possible triples of assassins (see
+    TRIPLES), and updated from the states seen at the beginning of the
+    turns of player 1: the triples without a revealed villager, or whose
+    arrest would have ended the game, are ruled out, and the triples of the
+    villagers that moved towards the king are favoured by a factor of
+    'approach' (and disfavoured when they moved away from it).
+
+    Every observation is applied in a single pass over the triples, as a
+    product of per-villager factors (see MEMBERS), and normalised once.
+    '''
+    def __init__(self, approach=1.3):
+        self.__approach = approach
+        self.__weights = [1 / len(TRIPLES)] * len(TRIPLES)
+        self.__cumulative = None
+        self.__seen = None
+
+    def observe(self, state):
+        '''Update the beliefs with a new state.
+
+        Pre: 'state' is the state seen by player 1 at the beginning of its
+             turn, the opponent's moves being in 'lastopponentmove'
+        Post: The weights have been updated and normalised.
+        '''
+        visible = state._state['visible']
+        people = state._people
+        masks = state._masks
+        onboard = {PAWNS[people[i]] for i in _bits(masks[CLASSOF[FIRSTVILLAGER]])}
+        # Bitmasks of the revealed and arrested villagers, and factor of the moves of each one
+        revealed = arrested = 0
+        factors = [1.0] * len(POPULATION)
+        for name in visible['arrested']:
+            arrested |= 1 << CODES[name] - FIRSTVILLAGER
+        # Villagers gone without being arrested have been revealed
+        if self.__seen is not None:
+            for name in self.__seen - onboard - set(visible['arrested']):
+                revealed |= 1 << CODES[name] - FIRSTVILLAGER
+        self.__seen = onboard
+        # Replay the opponent's moves backwards to know who moved where
+        king = masks[CLASSOF[KING]].bit_length() - 1
+        board = bytearray(people)
+        for action in reversed(visible['lastopponentmove']):
+            if action[0] != 'move':
+                continue
+            i = 10 * int(action[1]) + int(action[2])
+            t = NEIGHBOURS[i][action[3]]
+            code = board[t]
+            board[t], board[i] = EMPTY, code
+            if code >= FIRSTVILLAGER:
+                factors[code - FIRSTVILLAGER] *= self.__approach ** (_manhattan(i, king) - _manhattan(t, king))
+        # The triples must contain the revealed villagers, and the game
+        # would be over if all the assassins were arrested or killed
+        killed = visible['killed']['assassins']
+        weights = [w * factors[a] * factors[b] * factors[c]
+                   if t & revealed == revealed and killed + bin(t & arrested).count('1') < 3 else 0.0
+                   for w, t, (a, b, c) in zip(self.__weights, TRIPLES, MEMBERS)]
+        total = sum(weights)
+        if total > 0:
+            self.__weights = [w / total for w in weights]
+            self.__cumulative = None
+
+    def probability(self, name):
+        '''Get the probability that the villager 'name' is an assassin.'''
+        bit = 1 << CODES[name] - FIRSTVILLAGER
+        return sum(w for w, t in zip(self.__weights, TRIPLES) if t & bit)
+
+    def marginals(self):
+        '''Get the probability of every villager to be an assassin, as a dictionary.'''
+        result = [0.0] * len(POPULATION)
+        for w, (a, b, c) in zip(self.__weights, MEMBERS):
+            result[a] += w
+            result[b] += w
+            result[c] += w
+        return {PAWNS[FIRSTVILLAGER + k]: p for k, p in enumerate(result)}
+
+    def sample(self, rng):
+        '''Sample a triple of assassins according to the beliefs.
+
+        Pre: 'rng' is a random.Random instance
+        Post: The returned value is a set of three villagers' names.
+        '''
+        if self.__cumulative is None:
+            self.__cumulative = list(itertools.accumulate(self.__weights))
+        cumulative = self.__cumulative
+        t = min(bisect.bisect_right(cumulative, rng.random() * cumulative[-1]), len(TRIPLES) - 1)
+        return {PAWNS[FIRSTVILLAGER + k] for k in MEMBERS[t]}
+
+
+def _manhattan(i, j):
+    return abs(i // 10 - j // 10) + abs(i % 10 - j % 10)
+
+
 class KingAndAssassinsServer(game.GameServer):
-    '''Class representing a server for the King & Assassins game'''
+    '''Class representing a server for the King & Assassins game
+
+    In a session of 'games' games, every deal is played twice, once from
+    each side: the games 2k and 2k + 1 are dealt with 'seed' + k (or with
+    a random seed without 'seed', except the first deal).
+    '''
+
+    def __init__(self, verbose=False, seed=None, timecontrol=None, recorder=None, games=1, onfinish=None, retries=3):
+        self.__first = seed
+        super().__init__('King & Assassins', 2, self.__deal(seed), verbose=verbose, timecontrol=timecontrol,
+                         recorder=recorder, games=games, retries=retries, onfinish=onfinish)
+
+    def __deal(self, seed):
+        # Shuffle the villagers and the deck with 'seed' (at random if None)
+        if seed is None:
+            rng, state = random, KingAndAssassinsState()
+        else:
+            rng = random.Random(seed)
+            state = KingAndAssassinsState(initialstate(rng))
+        state._state['hidden'] = {
+            'assassins': None,
+            'cards': rng.sample(CARDS, len(CARDS))
+        }
+        self.__seed = seed
+        self.__dealt = copy.deepcopy(state)
+        return state
+
+    def _newstate(self, number):
+        # The sides have been swapped: replay the last deal every other game
+        if number % 2 == 1:
+            return copy.deepcopy(self.__dealt)
+        return self.__deal(random.getrandbits(32) if self.__first is None else self.__first + number // 2)
 
-    def __init__(self, verbose=False):
-        super().__init__('King & Assassins', 2, KingAndAssassinsState(), verbose=verbose)
-        self._state._state['hidden'] = {
+    @classmethod
+    def fromrecord(cls, header):
+        '''Build a server in the initial state of a recorded game.
+
+        Pre: 'header' is the header of a record written by this server
+        Post: The returned value is a new server, whose villagers and deck
+              are the recorded ones.
+        '''
+        server = cls(seed=header['seed'])
+        people = [[None if p in POPULATION else p for p in row] for row in PEOPLE]
+        for villager, (x, y) in zip(header['villagers'], sorted(VILLAGERS)):
+            people[x][y] = villager
+        server._state = KingAndAssassinsState(dict(KA_INITIAL_STATE, people=people), {
             'assassins': None,
-            'cards': random.sample(CARDS, len(CARDS))
+            'cards': [CARDS[i] for i in header['deck']]
+        })
+        return server
+
+    def _recordheader(self):
+        state = self._state
+        return {
+            'seed': self.__seed,
+            'villagers': [PAWNS[state._people[10 * x + y]] for x, y in sorted(VILLAGERS)],
+            'deck': [CARDS.index(tuple(card)) for card in state._state['hidden']['cards']]
+        }
+
+    def _checkpoint(self):
+        state = self._state
+        hidden = state._state['hidden']
+        return {
+            'state': base64.b64encode(state.encode()).decode(),
+            'player': state.player,
+            'assassins': None if hidden['assassins'] is None else sorted(hidden['assassins']),
+            'cards': [CARDS.index(tuple(card)) for card in hidden['cards']]
+        }
+
+    def _restore(self, checkpoint):
+        state = KingAndAssassinsState.decode(base64.b64decode(checkpoint['state']))
+        state._state['hidden'] = {
+            'assassins': None if checkpoint['assassins'] is None else set(checkpoint['assassins']),
+            'cards': [CARDS[i] for i in checkpoint['cards']]
         }
+        state.player = checkpoint['player']
+        self._state = state
 
     def _setassassins(self, move):
         state = self._state
@@ -298,26 +1178,52 @@ class KingAndAssassinsServer(game.GameServer):
         except game.InvalidMoveException as e:
             raise e
         except Exception as e:
-            print(e)
-            raise game.InvalidMoveException('A valid move must be a dictionary')
+            raise game.InvalidMoveException('A valid move must be a dictionary ({})'.format(e)) from e
 
 
 class KingAndAssassinsClient(game.GameClient):
     '''Class representing a client for the King & Assassins game'''
 
-    def __init__(self, name, server, verbose=False):
+    def __init__(self, name, server, verbose=False, engine=None, ponder=False, games=None):
         self.__name = name
+        self.__engine = engine
+        self._newgame()
+        super().__init__(server, KingAndAssassinsState, verbose=verbose, name=name, ponder=ponder, games=games)
+
+    def _newgame(self):
+        # Forget the cards, beliefs and positions of the last game, the
+        # engine keeping its tables
+        self.__cards = []
+        self.__belief = AssassinBelief()
         self.__actualpos=dict()
         self.__actualpos['knights']=dict()
         self.__actualpos['plebs'] = dict()
         self.__actualpos['assassins'] = dict()
         self.__compt=dict()
-        super().__init__(server, KingAndAssassinsState, verbose=verbose)
+        if hasattr(self.__engine, 'newgame'):
+            self.__engine.newgame()
 
+    def close(self):
+        # Stop the worker processes of the engine, if any
+        if hasattr(self.__engine, 'close'):
+            self.__engine.close()
 
     def _handle(self, message):
         pass
 
+    def _ponder(self, state, move, stop):
+        # The engine, if it played the turn, searches the replies to it
+        if not hasattr(self.__engine, 'ponder') or state.budget(self._playernb) is None:
+            return
+        actions = [tuple(action) for action in json.loads(move)['actions']]
+        for action in actions:
+            state.play(action)
+        try:
+            self.__engine.ponder(state, stop)
+        finally:
+            for action in actions:
+                state.undo()
+
     def _nextmove(self, state):
         # Two possible situations:
         # - If the player is the first to play, it has to select his/her assassins
@@ -329,7 +1235,46 @@ class KingAndAssassinsClient(game.GameClient):
         #   ('kill', x, y, dir): kills the assassin/knight in direction dir with knight/assassin at position (x, y)
         #   ('attack', x, y, dir): attacks the king in direction dir with assassin at position (x, y)
         #   ('reveal', x, y): reveals villager at position (x,y) as an assassin
-        state = state._state['visible']
+        # Every turn of this player comes with a newly drawn card
+        if state.budget(self._playernb) is not None:
+            self.__cards.append(state._state['visible']['card'])
+            state.setdrawn(self.__cards)
+        # A search engine, if any, plays the whole turn, knowing the chosen
+        # assassins for player 0 and its beliefs about them for player 1
+        if self.__engine is not None and state.budget(self._playernb) is not None:
+            if self._playernb == 0:
+                state.setassassins(self.assassins_list)
+            else:
+                self.__belief.observe(state)
+                state.setbelief(self.__belief)
+            state.player = self._playernb
+            if hasattr(self.__engine, 'advance'):
+                self.__engine.advance([tuple(action) for action in state._state['visible']['lastopponentmove']])
+            timeout = clock.allot(self._clock) if self._clock is not None else None
+            return json.dumps({'actions': self.__engine.nextturn(state, timeout)}, separators=(',', ':'))
+        move = self._handcodedmove(state.visible)
+        # The hand-coded bot does not count its action points and may block
+        # its own pawns, so only the longest legal prefix of its turn is sent
+        if state.budget(self._playernb) is not None:
+            move = json.dumps({'actions': self._legalprefix(state, json.loads(move)['actions'] if move else [])},
+                              separators=(',', ':'))
+        return move
+
+    def _legalprefix(self, state, actions):
+        if self._playernb == 0:
+            state.setassassins(self.assassins_list)
+        search = state.copy()
+        search.player = self._playernb
+        prefix = []
+        for action in actions:
+            try:
+                search.play(tuple(action))
+            except game.InvalidMoveException:
+                break
+            prefix.append(action)
+        return prefix
+
+    def _handcodedmove(self, state):
         #defines the assasins with their position instead of their name
         if state['card'] is None:
             if self._playernb==0:
@@ -737,31 +1682,180 @@ class KingAndAssassinsClient(game.GameClient):
                 return json.dumps({'actions': []}, separators=(',', ':'))
 
 
+def makeengine(name, budget=1.0, playouts=1000, workers=1):
+    '''Build the search engine with the specified name ('alphabeta', 'expectimax', 'ismcts' or None).'''
+    if name == 'alphabeta':
+        return search.AlphaBetaEngine(budget=budget)
+    if name == 'expectimax':
+        return search.ExpectimaxEngine(budget=budget)
+    if name == 'ismcts':
+        return mcts.ISMCTSEngine(playouts=playouts, workers=workers)
+    return None
+
+
+def makebot(entry, budget=1.0, playouts=1000):
+    '''Build the engine of a bot from its entry point.
+
+    Pre: 'entry' is 'handcoded', 'alphabeta', 'expectimax', 'ismcts' or
+         'module:function',
+         where function() returns an engine (see KingAndAssassinsClient)
+    Post: The returned value is the engine, None for the hand-coded bot.
+    '''
+    if entry == 'handcoded':
+        return None
+    if ':' in entry:
+        module, function = entry.split(':', 1)
+        return getattr(importlib.import_module(module), function)()
+    return makeengine(entry, budget, playouts)
+
+
+def makematch(seed, pairing, roster, budget=1.0, playouts=1000, timecontrol=None):
+    '''Build a seeded server and the clients of two bots for tournament.run().
+
+    Pre: 'roster' maps the names of 'pairing' to their entry points (see makebot())
+    '''
+    server = KingAndAssassinsServer(seed=seed, timecontrol=timecontrol)
+    players = [KingAndAssassinsClient(name, None, engine=makebot(roster[name], budget, playouts)) for name in pairing]
+    return server, players
+
+
+def makegame(seed, engine=None, budget=1.0, playouts=1000, timecontrol=None, recordpath=None, assassins=None):
+    '''Build a seeded server and two in-process clients for selfplay.playgames().
+
+    Pre: 'engine' and 'assassins' are the names of the engines of player 1
+         and player 0 respectively (see makeengine())
+    '''
+    recorder = record.RecordWriter(recordpath) if recordpath is not None else None
+    server = KingAndAssassinsServer(seed=seed, timecontrol=timecontrol, recorder=recorder)
+    players = [
+        KingAndAssassinsClient('player0', None, engine=makeengine(assassins, budget, playouts)),
+        KingAndAssassinsClient('player1', None, engine=makeengine(engine, budget, playouts))
+    ]
+    return server, players
+
+
 if __name__ == '__main__':
     # Create the top-level parser
     parser = argparse.ArgumentParser(description='King & Assassins game')
     subparsers = parser.add_subparsers(
-        description='server client',
+        description='server client selfplay tournament replay',
         help='King & Assassins game components',
         dest='component'
     )
 
     # Create the parser for the 'server' subcommand
     server_parser = subparsers.add_parser('server', help='launch a server')
-    server_parser.add_argument('--host', help='hostname (default: localhost)', default='localhost')
-    server_parser.add_argument('--port', help='port to listen on (default: 5000)', default=5000)
+    server_parser.add_argument('--host', help='hostname (default: localhost)',
+                               default=socket.gethostbyname(socket.gethostname()))
+    server_parser.add_argument('--port', help='port to listen on (default: 5000)', type=int, default=5000)
+    server_parser.add_argument('--lobby', help='host any number of concurrent games', action='store_true')
+    server_parser.add_argument('--record', help='append the records of the games to this file')
+    server_parser.add_argument('--metrics', help='append the per-turn metrics of every game to this file, one JSON line per game')
+    server_parser.add_argument('--timecontrol', help='move:S, bank:B or fischer:B+I (seconds, default: none)',
+                               type=clock.TimeControl.parse)
+    server_parser.add_argument('--games', help='games per connection, sides swapped after every game, 0 for no limit (default: 1)',
+                               type=int, default=1)
     server_parser.add_argument('-v', '--verbose', action='store_true')
     # Create the parser for the 'client' subcommand
     client_parser = subparsers.add_parser('client', help='launch a client')
     client_parser.add_argument('name', help='name of the player')
     client_parser.add_argument('--host', help='hostname of the server (default: localhost)',
                                default=socket.gethostbyname(socket.gethostname()))
-    client_parser.add_argument('--port', help='port of the server (default: 5000)', default=5000)
+    client_parser.add_argument('--port', help='port of the server (default: 5000)', type=int, default=5000)
+    client_parser.add_argument('--engine', help='search engine playing the turns of the client',
+                               choices=['alphabeta', 'expectimax', 'ismcts'])
+    client_parser.add_argument('--budget', help='thinking time per turn in seconds (default: 1)', type=float, default=1.0)
+    client_parser.add_argument('--playouts', help='ISMCTS playouts per turn (default: 1000)', type=int, default=1000)
+    client_parser.add_argument('--workers', help='ISMCTS worker processes (default: 1)', type=int, default=1)
+    client_parser.add_argument('--ponder', help="let the engine think during the opponent's turns (expectimax and ismcts)",
+                               action='store_true')
+    client_parser.add_argument('--games', help='games to play on the connection, if the server offers more (default: no limit)',
+                               type=int)
     client_parser.add_argument('-v', '--verbose', action='store_true')
+    # Create the parser for the 'selfplay' subcommand
+    selfplay_parser = subparsers.add_parser('selfplay', help='play games in-process')
+    selfplay_parser.add_argument('--games', help='number of games (default: 100)', type=int, default=100)
+    selfplay_parser.add_argument('--workers', help='worker processes (default: 1)', type=int, default=1)
+    selfplay_parser.add_argument('--seed', help='seed of the first game (default: 0)', type=int, default=0)
+    selfplay_parser.add_argument('--engine', help='search engine playing for player 1',
+                                 choices=['alphabeta', 'expectimax', 'ismcts'])
+    selfplay_parser.add_argument('--assassins', help='search engine playing for player 0',
+                                 choices=['alphabeta', 'expectimax', 'ismcts'])
+    selfplay_parser.add_argument('--budget', help='thinking time per turn in seconds (default: 1)', type=float, default=1.0)
+    selfplay_parser.add_argument('--playouts', help='ISMCTS playouts per turn (default: 1000)', type=int, default=1000)
+    selfplay_parser.add_argument('--timecontrol', help='move:S, bank:B or fischer:B+I (seconds, default: none)',
+                                 type=clock.TimeControl.parse)
+    selfplay_parser.add_argument('--record', help='append the records of the games to this file')
+    # Create the parser for the 'tournament' subcommand
+    tournament_parser = subparsers.add_parser('tournament', help='play a tournament between bots')
+    tournament_parser.add_argument('bots', help='NAME=ENTRY, where ENTRY is handcoded, alphabeta, expectimax, ismcts or module:function',
+                                   nargs='+')
+    tournament_parser.add_argument('--system', help='pairing system (default: roundrobin)',
+                                   choices=['roundrobin', 'swiss'], default='roundrobin')
+    tournament_parser.add_argument('--rounds', help='number of rounds (default: 1)', type=int, default=1)
+    tournament_parser.add_argument('--workers', help='worker processes (default: 1)', type=int, default=1)
+    tournament_parser.add_argument('--seed', help='seed of the first game (default: 0)', type=int, default=0)
+    tournament_parser.add_argument('--output', help='results file, one JSON line per game (default: tournament.jsonl)',
+                                   default='tournament.jsonl')
+    tournament_parser.add_argument('--budget', help='thinking time per turn in seconds (default: 1)', type=float, default=1.0)
+    tournament_parser.add_argument('--playouts', help='ISMCTS playouts per turn (default: 1000)', type=int, default=1000)
+    tournament_parser.add_argument('--timecontrol', help='move:S, bank:B or fischer:B+I (seconds, default: none)',
+                                   type=clock.TimeControl.parse)
+    # Create the parser for the 'replay' subcommand
+    replay_parser = subparsers.add_parser('replay', help='list or replay recorded games')
+    replay_parser.add_argument('file', help='file of game records')
+    replay_parser.add_argument('--game', help='number of the game to replay (default: list the games)', type=int)
+    replay_parser.add_argument('--turn', help='turn to show (default: the end of the game)', type=int)
     # Parse the arguments of sys.args
     args = parser.parse_args()
+    if args.component == 'client' and args.ponder and args.engine not in ('expectimax', 'ismcts'):
+        client_parser.error('--ponder requires --engine expectimax or ismcts')
 
     if args.component == 'server':
-        KingAndAssassinsServer(verbose=args.verbose).run()
+        recorder = record.RecordWriter(args.record) if args.record is not None else None
+        games = args.games if args.games > 0 else None
+        # One JSON object per line and per finished game, in both modes
+        def writemetrics(server, number=0):
+            with open(args.metrics, 'a') as file:
+                entry = {'match': number, 'game': server.played, 'turns': server.turns,
+                         'metrics': server.metrics.todict()}
+                file.write(json.dumps(entry) + '\n')
+        if args.lobby:
+            factory = lambda: KingAndAssassinsServer(seed=random.getrandbits(32), timecontrol=args.timecontrol,
+                                                     recorder=recorder, games=games)
+            onfinish = (lambda number, server: writemetrics(server, number)) if args.metrics is not None else None
+            game.AsyncGameServer(factory, 2, verbose=args.verbose, onfinish=onfinish).run(args.host, args.port)
+        else:
+            server = KingAndAssassinsServer(verbose=args.verbose, timecontrol=args.timecontrol, recorder=recorder,
+                                            games=games, onfinish=writemetrics if args.metrics is not None else None)
+            server.run(args.host, args.port)
+    elif args.component == 'selfplay':
+        factory = functools.partial(makegame, engine=args.engine, budget=args.budget, playouts=args.playouts,
+                                    timecontrol=args.timecontrol, recordpath=args.record, assassins=args.assassins)
+        stats = selfplay.playgames(factory, args.games, workers=args.workers, seed=args.seed)
+        print(json.dumps(stats, indent=2))
+    elif args.component == 'tournament':
+        roster = dict(bot.split('=', 1) if '=' in bot else (bot, bot) for bot in args.bots)
+        factory = functools.partial(makematch, roster=roster, budget=args.budget, playouts=args.playouts,
+                                    timecontrol=args.timecontrol)
+        with open(args.output, 'w') as output:
+            elo = tournament.run(factory, list(roster), rounds=args.rounds, system=args.system,
+                                 workers=args.workers, seed=args.seed, output=output)
+        print(json.dumps(elo.standings(), indent=2))
+    elif args.component == 'replay':
+        reader = record.RecordReader(args.file)
+        offsets = reader.index()
+        if args.game is None:
+            for number, game_record in enumerate(reader):
+                print('#{}: {} turns, winner: {}, forfeit: {}'.format(number, game_record.turns, game_record.winner,
+                                                                     game_record.forfeit))
+        else:
+            game_record = reader.read(offsets[args.game])
+            server = KingAndAssassinsServer.fromrecord(game_record.header)
+            record.replay(server, game_record, args.turn)
+            print('Game #{}, turn {}/{}:'.format(args.game, server.turns, game_record.turns))
+            server._state.prettyprint()
     else:
-        KingAndAssassinsClient(args.name, (args.host, args.port), verbose=args.verbose)
+        engine = makeengine(args.engine, args.budget, args.playouts, args.workers)
+        KingAndAssassinsClient(args.name, (args.host, args.port), verbose=args.verbose, engine=engine,
+                               ponder=args.ponder, games=args.games)
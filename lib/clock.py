@@ -0,0 +1,121 @@
+# clock.py
+# Version: October 17, 2026
+
+
+class TimeControl:
+    '''Class representing the time control of a game.
+
+    A player may be given a fixed time per move ('move'), a total bank of
+    time for the game ('bank'), possibly increased by 'increment' seconds
+    after every move (Fischer increment), or a combination of them.
+    '''
+    def __init__(self, bank=None, increment=0.0, move=None):
+        if bank is None and move is None:
+            raise ValueError('A time control needs a bank or a time per move')
+        self.__bank = bank
+        self.__increment = increment
+        self.__move = move
+
+    @property
+    def bank(self):
+        return self.__bank
+
+    @property
+    def increment(self):
+        return self.__increment
+
+    @property
+    def move(self):
+        return self.__move
+
+    @classmethod
+    def parse(cls, spec):
+        '''Build a time control from a specification.
+
+        Pre: 'spec' is 'move:S' (S seconds per move), 'bank:B' (B seconds
+             for the game) or 'fischer:B+I' (B seconds for the game and I
+             more seconds after each move)
+        Post: The returned value is the corresponding TimeControl.
+        Raises ValueError: If 'spec' is not valid.
+        '''
+        kind, _, value = spec.partition(':')
+        try:
+            if kind == 'move':
+                return cls(move=float(value))
+            if kind == 'bank':
+                return cls(bank=float(value))
+            if kind == 'fischer':
+                bank, _, increment = value.partition('+')
+                return cls(bank=float(bank), increment=float(increment or 0))
+        except ValueError:
+            pass
+        raise ValueError('{}: invalid time control'.format(spec))
+
+    def __str__(self):
+        if self.__bank is None:
+            return 'move:{:g}'.format(self.__move)
+        if self.__increment:
+            return 'fischer:{:g}+{:g}'.format(self.__bank, self.__increment)
+        return 'bank:{:g}'.format(self.__bank)
+
+
+class Clock:
+    '''Class representing the clocks of the players of a game.'''
+    def __init__(self, control, nbplayers):
+        self.__control = control
+        self.__left = [control.bank] * nbplayers
+
+    @property
+    def control(self):
+        return self.__control
+
+    def left(self, i):
+        '''Get the time left in the bank of player 'i' (None without bank).'''
+        return self.__left[i]
+
+    def allowed(self, i):
+        '''Get the time player 'i' has for its next move, in seconds.'''
+        left, move = self.__left[i], self.__control.move
+        if left is None:
+            return move
+        return max(0.0, left if move is None else min(left, move))
+
+    def spend(self, i, elapsed):
+        '''Charge 'elapsed' seconds to player 'i'.
+
+        Pre: -
+        Post: The bank of player 'i' has been reduced. The returned value is
+              True if the player exceeded its allowed time (flagged).
+        '''
+        flagged = elapsed > self.allowed(i)
+        if self.__left[i] is not None:
+            self.__left[i] -= elapsed
+        return flagged
+
+    def moved(self, i):
+        '''Credit the increment to player 'i', after a valid move.'''
+        if self.__left[i] is not None:
+            self.__left[i] += self.__control.increment
+
+    def todict(self, i):
+        '''Get the clock of player 'i' as sent to the client.'''
+        return {
+            'left': self.__left[i],
+            'allowed': self.allowed(i),
+            'increment': self.__control.increment,
+            'move': self.__control.move
+        }
+
+
+def allot(clock, moves=20, margin=0.8):
+    '''Get the time to spend on the next move.
+
+    Pre: 'clock' is a dictionary as returned by Clock.todict()
+    Post: The returned value is the thinking time, in seconds, so that the
+          bank lasts about 'moves' more moves, keeping a safety 'margin'
+          of the time allowed for the move.
+    '''
+    budget = clock['allowed']
+    if clock['left'] is not None:
+        budget = min(budget, clock['left'] / moves + clock['increment'])
+    return margin * budget
@@ -4,11 +4,20 @@
 
 from abc import *
 import copy
+import asyncio
+import itertools
 import json
 import socket
-import sys
+import struct
+import threading
+import time
+
+from lib import clock
+from lib import metrics
+from lib import record
 
 DEFAULT_BUFFER_SIZE = 1024
+DEFAULT_PORT = 5000
 SECTION_WIDTH = 60
 
 
@@ -23,6 +32,106 @@ class InvalidMoveException(Exception):
         super().__init__(message)
 
 
+class Connection:
+    '''Class representing a connection exchanging length-prefixed messages.
+
+    Every message is sent as a 4-byte big-endian length followed by its
+    UTF-8 payload. Received bytes are accumulated with recv_into() in a
+    reusable buffer, so that messages spanning several TCP segments, or
+    several messages received at once, are delimited correctly.
+    '''
+    HEADER = struct.Struct('!I')
+
+    def __init__(self, sock, buffersize=DEFAULT_BUFFER_SIZE):
+        self.__socket = sock
+        self.__buffer = bytearray(max(buffersize, Connection.HEADER.size))
+        self.__start = 0
+        self.__end = 0
+        # Bytes exchanged, length prefixes included
+        self.__sent = 0
+        self.__received = 0
+
+    @property
+    def socket(self):
+        return self.__socket
+
+    @property
+    def sent(self):
+        return self.__sent
+
+    @property
+    def received(self):
+        return self.__received
+
+    def getpeername(self):
+        return self.__socket.getpeername()
+
+    def send(self, message):
+        '''Send a message.
+
+        Pre: 'message' is a str or a bytes-like object
+        Post: The message has been sent with its length prefix.
+        Raises OSError: If the message could not be sent.
+        '''
+        if isinstance(message, str):
+            message = message.encode()
+        self.__socket.sendall(Connection.HEADER.pack(len(message)) + message)
+        self.__sent += Connection.HEADER.size + len(message)
+
+    def recv(self, binary=False, timeout=None):
+        '''Receive the next message.
+
+        Pre: -
+        Post: The returned value is the next message, as bytes if 'binary'
+              is True, and decoded as a str otherwise.
+        Raises ConnectionError: If the connection was closed before a whole
+               message has been received.
+        Raises TimeoutError: If 'timeout' seconds elapsed before a whole
+               message has been received.
+        '''
+        size = Connection.HEADER.size
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            self.__fill(size, deadline)
+            length = Connection.HEADER.unpack_from(self.__buffer, self.__start)[0]
+            self.__fill(size + length, deadline)
+        finally:
+            if deadline is not None:
+                self.__socket.settimeout(None)
+        start = self.__start + size
+        with memoryview(self.__buffer) as view:
+            message = bytes(view[start:start + length]) if binary else str(view[start:start + length], 'utf-8')
+        self.__start = start + length
+        if self.__start == self.__end:
+            self.__start = self.__end = 0
+        return message
+
+    def __fill(self, count, deadline=None):
+        # Read until at least 'count' bytes are buffered from __start
+        while self.__end - self.__start < count:
+            if deadline is not None:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    raise TimeoutError('No message received in time')
+                self.__socket.settimeout(left)
+            if self.__start + count > len(self.__buffer):
+                # Move the pending bytes to the front, and grow if needed
+                pending = self.__end - self.__start
+                self.__buffer[:pending] = self.__buffer[self.__start:self.__end]
+                self.__start, self.__end = 0, pending
+                if count > len(self.__buffer):
+                    self.__buffer.extend(bytes(max(count, 2 * len(self.__buffer)) - len(self.__buffer)))
+            with memoryview(self.__buffer) as view:
+                n = self.__socket.recv_into(view[self.__end:])
+            if n == 0:
+                raise ConnectionError('Connection closed by the peer')
+            self.__end += n
+            self.__received += n
+
+    def close(self):
+        self.__socket.close()
+
+
 class GameState(metaclass=ABCMeta):
     '''Abstract class representing a generic game state.'''
     def __init__(self, visible, hidden=None):
@@ -54,25 +163,107 @@ class GameState(metaclass=ABCMeta):
         Post: This state has been printed on stdout.'''
         ...
 
+    def publicstate(self):
+        '''Get the state as seen by the players.
+
+        Pre: -
+        Post: The returned value is a new state containing only the visible
+              part of this state, as a client would parse it.
+        '''
+        return self.__class__.parse(str(self))
+
     @classmethod
     def parse(cls, state):
         return cls(json.loads(state))
 
+    @classmethod
+    def capabilities(cls):
+        '''Get the optional protocol features supported by this class of states.
+
+        Pre: -
+        Post: The returned value is a tuple of feature names, among which
+              'delta' means that snapshot(), delta() and applydelta() are
+              implemented, and 'binary' that encode() and decode() are.
+        '''
+        return ()
+
+    def encode(self):
+        '''Get the visible state in a compact binary format, as bytes.'''
+        raise NotImplementedError()
+
+    @classmethod
+    def decode(cls, data):
+        '''Build a state from the bytes returned by encode() on the server.'''
+        raise NotImplementedError()
+
+    def snapshot(self):
+        '''Get an opaque snapshot of the visible state, for delta().'''
+        raise NotImplementedError()
+
+    def delta(self, snapshot):
+        '''Get the changes of the visible state since 'snapshot', as a str.'''
+        raise NotImplementedError()
+
+    def applydelta(self, delta):
+        '''Apply in place the changes returned by delta() on the server.'''
+        raise NotImplementedError()
+
     @classmethod
     def buffersize(cls):
         return DEFAULT_BUFFER_SIZE
 
 
 class GameServer(metaclass=ABCMeta):
-    '''Abstract class representing a generic game server.'''
-    def __init__(self, name, nbplayers, initialstate, verbose=False):
+    '''Abstract class representing a generic game server.
+
+    With a 'timecontrol' (see lib.clock.TimeControl), a player who does not
+    answer within its allowed time loses the game (see forfeit), and the
+    players that negotiated the 'clock' feature receive their clock in the
+    state messages.
+
+    With a 'recorder' (see lib.record.RecordWriter, or RecordBuffer to keep
+    the records in memory), every game is appended to it at the end, with a checkpoint of the state every
+    'checkpoints' turns if the game supports them (see _checkpoint()).
+
+    If given, 'onfinish' is called with the GameServer after every game,
+    once its result is known, for example to export its metrics.
+
+    A player whose move is rejected is asked again, and forfeits after
+    'retries' more rejected moves in a row (see forfeit).
+
+    With 'games' > 1 (None for no limit), the players stay connected for up
+    to 'games' games if all of them negotiated the 'session' feature: after
+    every game, each of them answers REMATCH or QUIT, and the server replies
+    'NEXT i', with the new number of the player, the sides being rotated
+    (see _nextgame()), or BYE if the session is over.
+    '''
+    def __init__(self, name, nbplayers, initialstate, verbose=False, timecontrol=None, recorder=None, checkpoints=10,
+                 games=1, retries=3, onfinish=None):
         self.__name = name
         self.__nbplayers = nbplayers
         self.__verbose = verbose
+        self.__retries = retries
+        self.__onfinish = onfinish
+        self.__played = 0
+        self.__games = games
+        self.__initialstate = copy.deepcopy(initialstate) if games != 1 else None
+        self.__timecontrol = timecontrol
+        self.__clock = None
+        self.__recorder = recorder
+        self.__checkpoints = checkpoints
+        self.__record = None
         self._state = initialstate
         # Stats about the running game
         self.__currentplayer = None
         self.__turns = 0
+        self.__forfeit = None
+        self.__failures = 0
+        self.__metrics = metrics.GameMetrics(nbplayers)
+        # Protocol features negotiated with each player, and their last view
+        self.__capabilities = [()] * nbplayers
+        self.__snapshots = [None] * nbplayers
+        # Bytes exchanged with each player before the current game
+        self.__traffic = [(0, 0)] * nbplayers
 
     @property
     def name(self):
@@ -82,6 +273,16 @@ class GameServer(metaclass=ABCMeta):
     def nbplayers(self):
         return self.__nbplayers
 
+    @property
+    def played(self):
+        '''The number of games played by this server.'''
+        return self.__played
+
+    @property
+    def games(self):
+        '''The maximal number of games per connection, None without limit.'''
+        return self.__games
+
     @property
     def currentplayer(self):
         return self.__currentplayer
@@ -90,6 +291,20 @@ class GameServer(metaclass=ABCMeta):
     def turns(self):
         return self.__turns
 
+    @property
+    def forfeit(self):
+        return self.__forfeit
+
+    @property
+    def clock(self):
+        '''The clocks of the current or last game, None without time control.'''
+        return self.__clock
+
+    @property
+    def metrics(self):
+        '''The measures of the current or last game (see lib.metrics.GameMetrics).'''
+        return self.__metrics
+
     @abstractmethod
     def applymove(self, move):
         '''Apply a move.
@@ -104,21 +319,212 @@ class GameServer(metaclass=ABCMeta):
     def state(self):
         return copy.deepcopy(self._state)
 
-    def _waitplayers(self):
+    def _startgame(self):
+        self.__currentplayer = 0
+        self.__turns = 0
+        self.__forfeit = None
+        self.__failures = 0
+        self.__snapshots = [None] * self.nbplayers
+        self.__metrics = metrics.GameMetrics(self.nbplayers)
+        if self.__timecontrol is not None:
+            self.__clock = clock.Clock(self.__timecontrol, self.nbplayers)
+        if self.__recorder is not None:
+            self.__record = record.GameRecord(self._recordheader())
+
+    def _recordheader(self):
+        '''Get what is needed to rebuild the initial state of the game, as a JSON-able value.'''
+        return {}
+
+    def _checkpoint(self):
+        '''Get the whole current state as a JSON-able value, or None if not supported.'''
+        return None
+
+    def _restore(self, checkpoint):
+        '''Restore the state saved by _checkpoint().'''
+        raise NotImplementedError()
+
+    def _seek(self, turn, player):
+        # Set the turn counter and the current player, for replays
+        self.__turns = turn
+        self.__currentplayer = player
+
+    def _endgame(self, winner):
+        # Save the record of the game that just ended, if any
+        self.__played += 1
+        if self.__record is not None:
+            self.__record.winner = winner
+            self.__record.forfeit = self.__forfeit
+            self.__recorder.append(self.__record)
+            self.__record = None
+        if self.__onfinish is not None:
+            self.__onfinish(self)
+
+    def _offer(self):
+        offer = self._state.__class__.capabilities()
+        if self.__timecontrol is not None:
+            offer += ('clock',)
+        return offer + ('session',) if self.__games != 1 else offer
+
+    def _newstate(self, number):
+        '''Get the initial state of the game 'number' of a session.
+
+        Pre: 'number' > 0 games of the session have already been played
+        Post: The returned value is a new state. It is a copy of the initial
+              state given to the constructor by default.
+        '''
+        return copy.deepcopy(self.__initialstate)
+
+    def _insession(self, i):
+        # Whether player 'i' negotiated the 'session' feature, and answers after every game
+        return 'session' in self.__capabilities[i]
+
+    def _rematch(self, number, replies):
+        # Whether the session goes on after 'number' games, given the
+        # answers of the players (None for those outside of the session)
+        return (self.__games is None or number < self.__games) and all(reply == 'REMATCH' for reply in replies)
+
+    def _nextgame(self, number, players):
+        '''Prepare the next game of a session.
+
+        Pre: 'number' games of the session have been played on the
+             connections 'players', in the order of the sides
+        Post: The sides have been rotated, player 0 becoming the last one,
+              and the returned value is the list of the connections in
+              their new order. The state is the one of _newstate(number).
+        '''
+        players = players[1:] + players[:1]
+        self.__capabilities = self.__capabilities[1:] + self.__capabilities[:1]
+        self.__traffic = [(player.sent, player.received) for player in players]
+        self._state = self._newstate(number)
+        return players
+
+    def _startmessage(self, i):
+        offer = self._offer()
+        return 'START {}'.format(i) + (' ' + ','.join(offer) if offer else '')
+
+    def _ready(self, i, reply):
+        # Parse 'READY [name] [caps=feature,...]', return (ready, name)
+        data = reply.split(' ')
+        if data[0] != 'READY':
+            return False, None
+        name = None
+        capabilities = ()
+        offer = self._offer()
+        for token in data[1:]:
+            if token.startswith('caps='):
+                capabilities = tuple(c for c in token[5:].split(',') if c in offer)
+            elif token != '':
+                name = token
+        self.__capabilities[i] = capabilities
+        return True, name
+
+    def _fullmessage(self, i):
+        state = self._state
+        if 'binary' in self.__capabilities[i]:
+            return b'BINARY ' + state.encode()
+        return 'PLAY {}'.format(state)
+
+    def _playmessage(self, i):
+        # Send deltas to the players that negotiated them and already have a full state
+        start = time.perf_counter()
+        state = self._state
+        if 'delta' not in self.__capabilities[i]:
+            message = self._fullmessage(i)
+        else:
+            if self.__snapshots[i] is None:
+                message = self._fullmessage(i)
+            else:
+                message = 'DELTA {}'.format(state.delta(self.__snapshots[i]))
+            self.__snapshots[i] = state.snapshot()
+        if 'clock' in self.__capabilities[i]:
+            # Insert the clock of the player as first token: 'PLAY clock={...} ...'
+            token = 'clock={}'.format(json.dumps(self.__clock.todict(i), separators=(',', ':')))
+            if isinstance(message, str):
+                command, rest = message.split(' ', 1)
+                message = '{} {} {}'.format(command, token, rest)
+            else:
+                command, rest = message.split(b' ', 1)
+                message = b' '.join((command, token.encode(), rest))
+        self.__metrics.serialize.record(time.perf_counter() - start)
+        return message
+
+    def _timeout(self, i):
+        # Time allowed to player 'i' for its move, None without time control
+        return None if self.__clock is None else self.__clock.allowed(i)
+
+    def _spendtime(self, i, elapsed):
+        # Charge the time spent by player 'i', return True if it flagged
+        return self.__clock is not None and self.__clock.spend(i, elapsed)
+
+    def _endmove(self):
+        # The current player played a valid move
+        if self.__clock is not None:
+            self.__clock.moved(self.__currentplayer)
+        self.__failures = 0
+        self._endturn()
+        if self.__record is not None and self.__turns % self.__checkpoints == 0:
+            checkpoint = self._checkpoint()
+            if checkpoint is not None:
+                self.__record.checkpoints[self.__turns] = (len(self.__record.moves), checkpoint)
+
+    def _flag(self, i):
+        # Player 'i' lost on time, return the winner
+        self.__forfeit = i
+        if self.__verbose:
+            print(' Player {} ran out of time.'.format(i))
+        return (i + 1) % self.nbplayers if self.nbplayers == 2 else None
+
+    def _reject(self, i):
+        # Player 'i' sent an invalid move, return the winner if it forfeits, -1 otherwise
+        self.__failures += 1
+        if self.__failures <= self.__retries:
+            return -1
+        self.__forfeit = i
+        if self.__verbose:
+            print(' Player {} forfeits after {} invalid moves.'.format(i, self.__failures))
+        return (i + 1) % self.nbplayers if self.nbplayers == 2 else None
+
+    def _applymove(self, move):
+        # Apply the move of the current player, measuring the rules engine
+        start = time.perf_counter()
+        valid = False
+        try:
+            self.applymove(move)
+            valid = True
+        except InvalidMoveException:
+            self.__metrics.invalid[self.__currentplayer] += 1
+            raise
+        finally:
+            self.__metrics.applymove.record(time.perf_counter() - start)
+            if self.__record is not None:
+                self.__record.moves.append((self.__currentplayer, move, valid))
+
+    def _traffic(self, i, connection):
+        sent, received = self.__traffic[i]
+        self.__metrics.sent[i] = connection.sent - sent
+        self.__metrics.received[i] = connection.received - received
+
+    def _endturn(self):
+        self.__turns += 1
+        self.__currentplayer = (self.__currentplayer + 1) % self.nbplayers
+
+    def _waitplayers(self, host=None, port=DEFAULT_PORT):
+        if host is None:
+            host = socket.gethostbyname(socket.gethostname())
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind((socket.gethostbyname(socket.gethostname()), 5000))
+        s.bind((host, port))
         s.listen(self.nbplayers)
         if self.__verbose:
             _printsection('Starting {}'.format(self.name))
-            print(' Game server listening on {}:{}.'.format(socket.gethostbyname(socket.gethostname()), 5000))
+            print(' Game server listening on {}:{}.'.format(host, port))
             print(' Waiting for {} players...'.format(self.nbplayers))
         self.__players = []
         # Wait for enough players for a play
         try:
             while len(self.__players) < self.__nbplayers:
                 client = s.accept()[0]
-                self.__players.append(client)
+                self.__players.append(Connection(client, self._state.__class__.buffersize()))
                 if self.__verbose:
                     print(' - Client connected from {}:{} ({}/{}).'
                           .format(*client.getpeername(), len(self.__players), self.nbplayers)
@@ -134,15 +540,15 @@ class GameServer(metaclass=ABCMeta):
                 if self.__verbose:
                     print(' Initialising player {}...'.format(i))
                 player = self.__players[i]
-                player.sendall('START {}'.format(i).encode())
-                data = player.recv(self._state.__class__.buffersize()).decode().split(' ')
-                if data[0] != 'READY':
+                player.send(self._startmessage(i))
+                ready, name = self._ready(i, player.recv())
+                if not ready:
                     if self.__verbose:
                         print(' - Player {} not ready to start.'.format(i))
                         _printsection('Current game ended')
                     return False
                 elif self.__verbose:
-                    print(' - Player {} ({}) ready to start.'.format(i, data[1] if len(data) == 2 else 'Anonymous'))
+                    print(' - Player {} ({}) ready to start.'.format(i, name if name is not None else 'Anonymous'))
         except OSError:
             if self.__verbose:
                 print('Error while notifying player {}.'.format(player))
@@ -153,60 +559,399 @@ class GameServer(metaclass=ABCMeta):
         return True
 
     def _gameloop(self):
-        self.__currentplayer = 0
+        number = 0
+        running = True
+        while running:
+            self.__playgame()
+            number += 1
+            running = self.__askrematch(number)
+        # Close the connexions with the clients
+        for player in self.__players:
+            player.close()
+        if self.__verbose:
+            _printsection('Game ended')
+
+    def __playgame(self):
+        self._startgame()
         winner = -1
         if self.__verbose:
             print(' Initial state:')
             self._state.prettyprint()
         # Loop until the game ends with a winner or with a draw
         while winner == -1:
-            player = self.__players[self.__currentplayer]
+            current = self.__currentplayer
+            player = self.__players[current]
             if self.__verbose:
-                print("\n=> Turn #{} (player {})".format(self.turns, self.__currentplayer))
-            player.sendall('PLAY {}'.format(self.state).encode())
+                print("\n=> Turn #{} (player {})".format(self.turns, current))
+            player.send(self._playmessage(current))
+            start = time.perf_counter()
             try:
-                move = player.recv(self._state.__class__.buffersize()).decode()
-                if self.__verbose:
-                    print('   Move:', move)
-                self.applymove(move)
-                self.__turns += 1
-                self.__currentplayer = (self.__currentplayer + 1) % self.nbplayers
+                move = player.recv(timeout=self._timeout(current))
+            except TimeoutError:
+                self._spendtime(current, time.perf_counter() - start)
+                winner = self._flag(current)
+                break
+            elapsed = time.perf_counter() - start
+            self.__metrics.recv[current].record(elapsed)
+            self._traffic(current, player)
+            if self._spendtime(current, elapsed):
+                winner = self._flag(current)
+                break
+            if self.__verbose:
+                print('   Move:', move)
+            try:
+                self._applymove(move)
+                self._endmove()
             except InvalidMoveException as e:
                 if self.__verbose:
                     print('Invalid move:', e)
-                player.sendall('ERROR {}'.format(e).encode())
+                player.send('ERROR {}'.format(e))
+                winner = self._reject(current)
+                if winner != -1:
+                    break
             if self.__verbose:
                 print('   State:')
                 self._state.prettyprint()
             winner = self._state.winner()
+        self._endgame(winner)
         if self.__verbose:
             _printsection('Game finished')
         # Notify players about won/lost status
         if winner is not None:
             for i in range(self.nbplayers):
-                self.__players[i].sendall(('WON' if winner == i else 'LOST').encode())
+                self.__players[i].send('WON' if winner == i else 'LOST')
             if self.__verbose:
                 print(' The winner is player {}.'.format(winner))
         # Notify players that the game ended
         else:
             for player in self.__players:
-                player.sendall('END'.encode())
-        # Close the connexions with the clients
-        for player in self.__players:
-            player.close()
+                player.send('END')
+
+    def __answer(self, player):
+        # The answer of a player to a rematch, skipping a move sent too late
+        reply = player.recv()
+        while reply not in ('REMATCH', 'QUIT'):
+            reply = player.recv()
+        return reply
+
+    def __askrematch(self, number):
+        # Ask the players of a session for another game, return True if it starts
+        try:
+            replies = [self.__answer(player) if self._insession(i) else None for i, player in enumerate(self.__players)]
+            if not self._rematch(number, replies):
+                for i, player in enumerate(self.__players):
+                    if self._insession(i):
+                        player.send('BYE')
+                return False
+            self.__players = self._nextgame(number, self.__players)
+            for i, player in enumerate(self.__players):
+                player.send('NEXT {}'.format(i))
+        except OSError:
+            return False
         if self.__verbose:
-            _printsection('Game ended')
+            _printsection('Game #{} of the session'.format(number + 1))
+        return True
 
-    def run(self):
-        if self._waitplayers():
+    def run(self, host=None, port=DEFAULT_PORT):
+        if self._waitplayers(host, port):
             self._gameloop()
 
+    def playlocal(self, players):
+        '''Play a whole game with in-process players, without any network.
+
+        Pre: 'players' are GameClient instances created without a server
+        Post: The game has been played by calling the _nextmove() method of
+              the players directly with the public state. A player whose
+              move is rejected is asked again, and forfeits as with the
+              network (see _reject()). With a time control, the players'
+              moves are not interrupted, but a player who exceeded its
+              allowed time loses. The returned value is the winner, as
+              returned by GameState.winner(). An error raised by a player
+              is propagated, and not taken for an invalid move.
+        '''
+        for i, player in enumerate(players):
+            player._playernb = i
+        self._startgame()
+        winner = -1
+        while winner == -1:
+            current = self.__currentplayer
+            player = players[current]
+            player._clock = None if self.__clock is None else self.__clock.todict(current)
+            start = time.perf_counter()
+            move = player._nextmove(self._state.publicstate())
+            elapsed = time.perf_counter() - start
+            self.__metrics.recv[current].record(elapsed)
+            if self._spendtime(current, elapsed):
+                winner = self._flag(current)
+                break
+            try:
+                self._applymove(move)
+                self._endmove()
+            except InvalidMoveException as e:
+                player._handle('ERROR {}'.format(e))
+                winner = self._reject(current)
+                if winner != -1:
+                    break
+            winner = self._state.winner()
+        self._endgame(winner)
+        return winner
+
+
+class AsyncConnection:
+    '''Class representing an asyncio connection with length-prefixed messages.
+
+    The framing is the same as for Connection. A message is read by a task
+    of its own, which a timeout does not cancel, so that a message received
+    late is not cut in the middle but returned by the next recv().
+    '''
+    def __init__(self, reader, writer):
+        self.__reader = reader
+        self.__writer = writer
+        self.__sent = 0
+        self.__received = 0
+        self.__pending = None
+
+    @property
+    def sent(self):
+        return self.__sent
+
+    @property
+    def received(self):
+        return self.__received
+
+    def getpeername(self):
+        return self.__writer.get_extra_info('peername')
+
+    async def send(self, message):
+        if isinstance(message, str):
+            message = message.encode()
+        self.__writer.write(Connection.HEADER.pack(len(message)) + message)
+        self.__sent += Connection.HEADER.size + len(message)
+        await self.__writer.drain()
+
+    async def recv(self, timeout=None):
+        '''Receive the next message.
+
+        Pre: -
+        Post: The returned value is the next message, decoded as a str.
+        Raises ConnectionError: If the connection was closed before a whole
+               message has been received.
+        Raises asyncio.TimeoutError: If 'timeout' seconds elapsed before a
+               whole message has been received.
+        '''
+        if self.__pending is None:
+            self.__pending = asyncio.ensure_future(self.__recvmessage())
+        pending = self.__pending
+        try:
+            message = await asyncio.wait_for(asyncio.shield(pending), timeout)
+        except asyncio.TimeoutError:
+            raise
+        except BaseException:
+            if pending.done():
+                self.__pending = None
+            raise
+        self.__pending = None
+        return message
+
+    async def __recvmessage(self):
+        try:
+            header = await self.__reader.readexactly(Connection.HEADER.size)
+            data = await self.__reader.readexactly(Connection.HEADER.unpack(header)[0])
+        except asyncio.IncompleteReadError:
+            raise ConnectionError('Connection closed by the peer')
+        self.__received += len(header) + len(data)
+        return data.decode()
+
+    async def close(self):
+        if self.__pending is not None:
+            self.__pending.cancel()
+        self.__writer.close()
+        try:
+            await self.__writer.wait_closed()
+        except OSError:
+            pass
+
+
+class AsyncGameServer:
+    '''Class representing an asyncio server hosting many concurrent games.
+
+    Every connected client waits in a lobby queue. As soon as enough clients
+    are waiting, they are paired into a match, played in its own task with
+    a fresh GameServer built by 'factory', whose applymove() and state's
+    winner() implement the rules exactly as for a single game. If the
+    players negotiated a session with it (see GameServer), the match goes
+    on with the same GameServer and the same connections, game after game.
+
+    If given, 'onfinish' is called with the number of the match after every
+    finished game and its GameServer, for example to export its metrics.
+    '''
+    def __init__(self, factory, nbplayers, verbose=False, onfinish=None):
+        self.__factory = factory
+        self.__nbplayers = nbplayers
+        self.__verbose = verbose
+        self.__onfinish = onfinish
+        self.__lobby = None
+        self.__matches = set()
+        self.__ids = itertools.count()
+        # Stats about the hosted games
+        self.__played = 0
+
+    @property
+    def nbplayers(self):
+        return self.__nbplayers
+
+    @property
+    def running(self):
+        return len(self.__matches)
+
+    @property
+    def played(self):
+        return self.__played
+
+    def run(self, host=None, port=DEFAULT_PORT):
+        if host is None:
+            host = socket.gethostbyname(socket.gethostname())
+        try:
+            asyncio.run(self.serve(host, port))
+        except KeyboardInterrupt:
+            if self.__verbose:
+                _printsection('Game server ended')
+
+    async def serve(self, host, port):
+        '''Accept clients on host:port and pair them into matches, forever.'''
+        self.__lobby = asyncio.Queue()
+        server = await asyncio.start_server(self.__connected, host, port, reuse_address=True)
+        if self.__verbose:
+            _printsection('Starting game server')
+            print(' Game server listening on {}:{}.'.format(host, port))
+        async with server:
+            pairing = asyncio.ensure_future(self.__pair())
+            try:
+                await server.serve_forever()
+            finally:
+                pairing.cancel()
+
+    async def __connected(self, reader, writer):
+        player = AsyncConnection(reader, writer)
+        if self.__verbose:
+            print(' - Client connected from {}:{}.'.format(*player.getpeername()[:2]))
+        await self.__lobby.put(player)
+
+    async def __pair(self):
+        while True:
+            players = [await self.__lobby.get() for i in range(self.__nbplayers)]
+            task = asyncio.ensure_future(self._match(next(self.__ids), self.__factory(), players))
+            self.__matches.add(task)
+            task.add_done_callback(self.__matches.discard)
+
+    async def _match(self, number, server, players):
+        try:
+            # Notify players that the game started
+            for i, player in enumerate(players):
+                await player.send(server._startmessage(i))
+                ready, name = server._ready(i, await player.recv())
+                if not ready:
+                    if self.__verbose:
+                        print(' Match #{}: player {} not ready to start.'.format(number, i))
+                    return
+            games = 0
+            while True:
+                if self.__verbose:
+                    print(' Match #{} started (game {}).'.format(number, games + 1))
+                server._startgame()
+                winner = -1
+                while winner == -1:
+                    current = server.currentplayer
+                    player = players[current]
+                    await player.send(server._playmessage(current))
+                    start = time.perf_counter()
+                    try:
+                        move = await player.recv(server._timeout(current))
+                    except asyncio.TimeoutError:
+                        server._spendtime(current, time.perf_counter() - start)
+                        winner = server._flag(current)
+                        break
+                    elapsed = time.perf_counter() - start
+                    server.metrics.recv[current].record(elapsed)
+                    server._traffic(current, player)
+                    if server._spendtime(current, elapsed):
+                        winner = server._flag(current)
+                        break
+                    try:
+                        server._applymove(move)
+                        server._endmove()
+                    except InvalidMoveException as e:
+                        await player.send('ERROR {}'.format(e))
+                        winner = server._reject(current)
+                        if winner != -1:
+                            break
+                    winner = server._state.winner()
+                server._endgame(winner)
+                # Notify players about won/lost status, or that the game ended
+                for i, player in enumerate(players):
+                    await player.send('END' if winner is None else 'WON' if winner == i else 'LOST')
+                self.__played += 1
+                if self.__verbose:
+                    print(' Match #{} finished after {} turns (winner: {}).'.format(number, server.turns, winner))
+                if self.__onfinish is not None:
+                    self.__onfinish(number, server)
+                games += 1
+                # Play again on the same connections, with the sides rotated
+                replies = [await self.__answer(player) if server._insession(i) else None
+                           for i, player in enumerate(players)]
+                if not server._rematch(games, replies):
+                    for i, player in enumerate(players):
+                        if server._insession(i):
+                            await player.send('BYE')
+                    break
+                players = server._nextgame(games, players)
+                for i, player in enumerate(players):
+                    await player.send('NEXT {}'.format(i))
+        except OSError as e:
+            if self.__verbose:
+                print(' Match #{} aborted: {}'.format(number, e))
+        finally:
+            for player in players:
+                await player.close()
+
+    async def __answer(self, player):
+        # The answer of a player to a rematch, skipping a move sent too late
+        reply = await player.recv()
+        while reply not in ('REMATCH', 'QUIT'):
+            reply = await player.recv()
+        return reply
+
 
 class GameClient(metaclass=ABCMeta):
-    '''Abstract class representing a game client'''
-    def __init__(self, server, stateclass, verbose=False):
+    '''Abstract class representing a game client
+
+    With 'ponder', the client keeps thinking while the other players play:
+    after every move sent to the server, _ponder() runs in a background
+    thread until the next message arrives.
+
+    If the server offers a session, the client stays connected to play up
+    to 'games' games (None for as many as the server hosts), keeping its
+    engine and the rest of its state, except what _newgame() resets.
+    '''
+    def __init__(self, server, stateclass, verbose=False, name=None, capabilities=None, ponder=False, games=None):
         self.__stateclass = stateclass
         self.__verbose = verbose
+        self.__name = name
+        self.__ponder = ponder
+        self.__pondering = None
+        self.__games = games
+        self.__played = 0
+        # Protocol features to accept (all the supported ones by default)
+        if capabilities is None:
+            capabilities = stateclass.capabilities() + ('clock',) + (('session',) if games != 1 else ())
+        self.__accepted = tuple(capabilities)
+        self.__capabilities = ()
+        self.__state = None
+        # Clock sent with the last state (see lib.clock.Clock.todict), if any
+        self._clock = None
+        # Without a server, the client is driven in-process (see GameServer.playlocal)
+        if server is None:
+            return
         if self.__verbose:
             _printsection('Starting game')
         addrinfos = socket.getaddrinfo(*server, socket.AF_INET, socket.SOCK_STREAM)
@@ -215,25 +960,54 @@ class GameClient(metaclass=ABCMeta):
             s.connect(addrinfos[0][4])
             if self.__verbose:
                 print(' Connected to the game server on {}:{}.'.format(*addrinfos[0][4]))
-            self.__server = s
+            self.__server = Connection(s, self.__stateclass.buffersize())
             self._gameloop()
         except OSError:
             print(' Impossible to connect to the game server on {}:{}.'.format(*addrinfos[0][4]))
+        finally:
+            self.close()
 
     def _gameloop(self):
         server = self.__server
         running = True
         while running:
-            data = server.recv(self.__stateclass.buffersize()).decode()
-            command = data[:data.index(' ')] if ' ' in data else data
+            data = server.recv(binary=True)
+            self.__stoppondering()
+            command = (data[:data.index(b' ')] if b' ' in data else data).decode()
+            if command in ('PLAY', 'DELTA', 'BINARY'):
+                # Strip the optional clock, the payload of BINARY is not text
+                data = data[len(command)+1:]
+                self._clock = None
+                if data.startswith(b'clock='):
+                    token, data = data.split(b' ', 1)
+                    self._clock = json.loads(token[6:])
+                if command != 'BINARY':
+                    data = data.decode()
+            else:
+                data = data.decode()
             if command == 'START':
-                self._playernb = int(data[data.index(' '):])
-                server.sendall('READY'.encode())
+                tokens = data.split(' ')
+                self._playernb = int(tokens[1])
+                offer = tokens[2].split(',') if len(tokens) > 2 else []
+                self.__capabilities = tuple(c for c in offer if c in self.__accepted)
+                reply = 'READY'
+                if self.__name is not None:
+                    reply += ' {}'.format(self.__name)
+                if self.__capabilities:
+                    reply += ' caps={}'.format(','.join(self.__capabilities))
+                server.send(reply)
                 if self.__verbose:
                     _printsection('Game started')
                     print("   Player's number: {}".format(self._playernb))
-            elif command == 'PLAY':
-                state = self.__stateclass.parse(data[data.index(' ')+1:])
+            elif command in ('PLAY', 'DELTA', 'BINARY'):
+                # Keep the last full state to apply the next deltas on it
+                if command == 'PLAY':
+                    self.__state = self.__stateclass.parse(data)
+                elif command == 'DELTA':
+                    self.__state.applydelta(data)
+                else:
+                    self.__state = self.__stateclass.decode(data)
+                state = copy.deepcopy(self.__state)
                 if self.__verbose:
                     print("\n=> Player's turn to play")
                     print('   State:')
@@ -241,9 +1015,11 @@ class GameClient(metaclass=ABCMeta):
                 move = self._nextmove(state)
                 if self.__verbose:
                     print('   Move:', move)
-                server.sendall(move.encode())
+                server.send(move)
+                if self.__ponder:
+                    self.__startpondering(state, move)
             elif command in ('WON', 'LOST', 'END'):
-                running = False
+                self.__played += 1
                 if self.__verbose:
                     _printsection('Game finished')
                     if command == 'WON':
@@ -252,12 +1028,70 @@ class GameClient(metaclass=ABCMeta):
                         print(' You lost the game.')
                     else:
                         print(' It is draw.')
-                    _printsection('Game ended')
-                server.close()
+                # In a session, the server waits for the answer of the client
+                if 'session' in self.__capabilities:
+                    server.send('REMATCH' if self.__games is None or self.__played < self.__games else 'QUIT')
+                else:
+                    running = False
+            elif command == 'NEXT':
+                self._playernb = int(data.split(' ')[1])
+                self.__state = None
+                self._clock = None
+                self._newgame()
+                if self.__verbose:
+                    _printsection('Game started')
+                    print("   Player's number: {}".format(self._playernb))
+            elif command == 'BYE':
+                running = False
             else:
                 if self.__verbose:
                     print('Specific data received:', data)
                 self._handle(data)
+        if self.__verbose:
+            _printsection('Game ended')
+        server.close()
+
+    def __startpondering(self, state, move):
+        stop = threading.Event()
+        thread = threading.Thread(target=self._ponder, args=(state, move, stop), daemon=True)
+        self.__pondering = (thread, stop)
+        thread.start()
+
+    def __stoppondering(self):
+        if self.__pondering is not None:
+            thread, stop = self.__pondering
+            stop.set()
+            thread.join()
+            self.__pondering = None
+
+    def _ponder(self, state, move, stop):
+        '''Think while the other players play (see 'ponder').
+
+        Pre: 'state' is the state passed to _nextmove(), which returned
+             'move', and 'stop' is a threading.Event
+        Post: The client has searched ahead, in a background thread, until
+              'stop' was set, which happens as soon as the next message of
+              the server is received. It does nothing by default.
+        '''
+        pass
+
+    def close(self):
+        '''Release the resources of the client, once it played its last game.
+
+        Pre: -
+        Post: The client has been closed, which is done once the connection
+              with the server is over. It does nothing by default.
+        '''
+        pass
+
+    def _newgame(self):
+        '''Prepare the client for the next game of a session.
+
+        Pre: -
+        Post: What the client knew about the previous game has been
+              forgotten. It does nothing by default.
+        '''
+        pass
 
     @abstractmethod
     def _handle(self, command):
@@ -0,0 +1,222 @@
+# mcts.py
+# Version: October 17, 2026
+
+import math
+import multiprocessing
+import random
+import time
+
+
+class _Node:
+    '''Node of an information set search tree.'''
+    __slots__ = ('action', 'player', 'parent', 'children', 'visits', 'wins', 'avails')
+
+    def __init__(self, action=None, player=None, parent=None):
+        self.action = action
+        self.player = player
+        self.parent = parent
+        self.children = {}
+        self.visits = 0
+        self.wins = 0.0
+        self.avails = 1
+
+
+class ISMCTSEngine:
+    '''Class representing an information set Monte Carlo tree search engine.
+
+    Every iteration samples a determinization of the root state, that is a
+    state whose hidden information is consistent with what the searching
+    player knows, and descends a single tree whose statistics are shared by
+    all the determinizations. The searched states must provide the 'player'
+    to move, determinize(rng), choices() (None ending the turn), play(action),
+    undo(), winner() and evaluate(player).
+
+    With 'workers' > 1, independent trees are searched in a process pool and
+    their root statistics are merged.
+    '''
+    def __init__(self, playouts=1000, workers=1, exploration=0.7, horizon=4, scale=100, seed=None):
+        self.__playouts = playouts
+        self.__workers = workers
+        self.__exploration = exploration
+        self.__horizon = horizon
+        self.__scale = scale
+        self.__rng = random.Random(seed)
+        self.__pool = None
+        # Tree searched while pondering, and its subtree matching the
+        # actions of the opponent (see advance())
+        self.__pondered = None
+        self.__reused = None
+
+    @property
+    def playouts(self):
+        return self.__playouts
+
+    @property
+    def workers(self):
+        return self.__workers
+
+    def close(self):
+        '''Stop the worker processes, if any.'''
+        if self.__pool is not None:
+            self.__pool.close()
+            self.__pool.join()
+            self.__pool = None
+
+    def ponder(self, state, stop):
+        '''Search the replies of the opponent, until 'stop' is set.
+
+        Pre: 'state' is the state after the actions of the turn of the player
+             to move, before it ends, 'stop' is a threading.Event
+        Post: A tree has been searched from the end of the turn, in batches
+              of a few playouts. Its subtree matching the actual replies can
+              be reused by the next search (see advance()). The 'state' is
+              left unchanged.
+        '''
+        state.play(None)
+        root = _Node()
+        try:
+            while not stop.is_set() and state.winner() == -1:
+                _search(root, state, 8, self.__rng, self.__exploration, self.__horizon, self.__scale)
+        finally:
+            state.undo()
+        self.__pondered = root
+
+    def advance(self, actions):
+        '''Tell the engine the actions played by the opponent since the last turn.
+
+        Pre: 'actions' is the list of the actions of the turn of the opponent
+        Post: The subtree of the pondered tree reached by these actions and
+              the end of the turn, if any, is the root of the next search.
+        '''
+        node = self.__pondered
+        for action in list(actions) + [None]:
+            if node is None:
+                break
+            node = node.children.get(action)
+        self.__pondered = None
+        self.__reused = node
+
+    def newgame(self):
+        '''Forget the pondered tree, which belongs to the last game.'''
+        self.__pondered = None
+        self.__reused = None
+
+    def nextturn(self, state, timeout=None):
+        '''Search the actions to play for the whole turn of the player to move.
+
+        Pre: 'state' is not a terminal state
+        Post: The returned value is a list of legal actions for the player
+              to move. The playout budget is shared between the actions of
+              the turn, which are cut short after 'timeout' seconds if
+              specified, and the 'state' is left unchanged.
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        player = state.player
+        actions = []
+        root, self.__reused = self.__reused, None
+        try:
+            while state.player == player and state.winner() == -1:
+                points = sum(state.ap) if state.ap is not None else 0
+                playouts = max(1, self.__playouts // (points + 1))
+                action, root = self.bestaction(state, playouts, root, deadline)
+                if action is None:
+                    break
+                state.play(action)
+                actions.append(action)
+        finally:
+            for action in actions:
+                state.undo()
+        return actions
+
+    def bestaction(self, state, playouts, root=None, deadline=None):
+        '''Search the best next action.
+
+        Pre: 'deadline' is None or a time.monotonic() timestamp after which
+             no more playouts are started
+        Post: The returned value is a pair (action, subtree) with the most
+              visited action of the player to move (None to end the turn)
+              and the subtree below it, which can be reused as the 'root'
+              of the search of the following action.
+        '''
+        choices = state.choices()
+        if len(choices) <= 1:
+            return (choices[0] if choices else None), None
+        if self.__workers > 1:
+            if self.__pool is None:
+                self.__pool = multiprocessing.Pool(self.__workers)
+            jobs = [(state, playouts // self.__workers, self.__rng.getrandbits(32), self.__exploration,
+                     self.__horizon, self.__scale, deadline) for i in range(self.__workers)]
+            visits = {}
+            for stats in self.__pool.map(_searchworker, jobs):
+                for action, count in stats.items():
+                    visits[action] = visits.get(action, 0) + count
+            return max(choices, key=lambda action: visits.get(action, 0)), None
+        if root is None:
+            root = _Node()
+        root.parent = None
+        _search(root, state, playouts, self.__rng, self.__exploration, self.__horizon, self.__scale, deadline)
+        best = max((child for child in root.children.values() if child.action in choices),
+                   key=lambda child: child.visits)
+        return best.action, best
+
+
+def _searchworker(job):
+    state, playouts, seed, exploration, horizon, scale, deadline = job
+    root = _Node()
+    _search(root, state, max(1, playouts), random.Random(seed), exploration, horizon, scale, deadline)
+    return {action: child.visits for action, child in root.children.items()}
+
+
+def _search(root, state, playouts, rng, exploration, horizon, scale, deadline=None):
+    player = state.player
+    for i in range(playouts):
+        if deadline is not None and i > 0 and time.monotonic() > deadline:
+            break
+        node = root
+        determinization = state.determinize(rng)
+        turns = 0
+        # Selection, among the children available in this determinization
+        while determinization.winner() == -1:
+            choices = determinization.choices()
+            untried = [action for action in choices if action not in node.children]
+            if untried:
+                break
+            best, bestvalue = None, -1.0
+            for action in choices:
+                child = node.children[action]
+                value = child.wins / child.visits + exploration * math.sqrt(math.log(child.avails) / child.visits)
+                if value > bestvalue:
+                    best, bestvalue = child, value
+                child.avails += 1
+            node = best
+            determinization.play(node.action)
+            turns += node.action is None
+        # Expansion
+        if determinization.winner() == -1:
+            choices = determinization.choices()
+            untried = [action for action in choices if action not in node.children]
+            for action in choices:
+                if action in node.children:
+                    node.children[action].avails += 1
+            if untried:
+                action = rng.choice(untried)
+                child = _Node(action, determinization.player, node)
+                node.children[action] = child
+                node = child
+                determinization.play(action)
+                turns += action is None
+        # Simulation, with random actions up to the horizon
+        while determinization.winner() == -1 and turns < horizon:
+            action = rng.choice(determinization.choices())
+            determinization.play(action)
+            turns += action is None
+        winner = determinization.winner()
+        if winner == -1:
+            reward = 1 / (1 + math.exp(-determinization.evaluate(player) / scale))
+        else:
+            reward = 0.5 if winner is None else float(winner == player)
+        # Backpropagation, from the point of view of the player of each node
+        while node is not None:
+            node.visits += 1
+            node.wins += reward if node.player == player else 1 - reward
+            node = node.parent
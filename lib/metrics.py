@@ -0,0 +1,103 @@
+# metrics.py
+# Version: October 17, 2026
+
+import json
+import math
+
+
+class Histogram:
+    '''Class representing a histogram of positive samples.
+
+    Samples are counted in logarithmic buckets whose bounds grow by a factor
+    1 + 'precision', so that the memory used does not depend on the number
+    of samples and percentiles are known within that relative precision.
+    '''
+    def __init__(self, precision=0.01):
+        self.__base = math.log1p(precision)
+        self.__buckets = {}
+        self.__count = 0
+        self.__total = 0.0
+        self.__min = None
+        self.__max = None
+
+    @property
+    def count(self):
+        return self.__count
+
+    @property
+    def total(self):
+        return self.__total
+
+    def record(self, value):
+        '''Add a sample to the histogram.'''
+        bucket = math.floor(math.log(value) / self.__base) if value > 0 else None
+        self.__buckets[bucket] = self.__buckets.get(bucket, 0) + 1
+        self.__count += 1
+        self.__total += value
+        if self.__min is None or value < self.__min:
+            self.__min = value
+        if self.__max is None or value > self.__max:
+            self.__max = value
+
+    def percentile(self, p):
+        '''Get the value below which 'p' percent of the samples are.
+
+        Pre: 0 <= 'p' <= 100
+        Post: The returned value is the upper bound of the bucket containing
+              the percentile, clamped to the extreme samples, or None if
+              there is no sample.
+        '''
+        if self.__count == 0:
+            return None
+        rank = max(1, math.ceil(p / 100 * self.__count))
+        seen = self.__buckets.get(None, 0)
+        if seen >= rank:
+            return self.__min
+        for bucket in sorted(b for b in self.__buckets if b is not None):
+            seen += self.__buckets[bucket]
+            if seen >= rank:
+                return min(self.__max, max(self.__min, math.exp((bucket + 1) * self.__base)))
+        return self.__max
+
+    def summary(self):
+        '''Get the count, total, mean, extremes and p50, p95 and p99 as a dictionary.'''
+        return {
+            'count': self.__count,
+            'total': self.__total,
+            'mean': self.__total / self.__count if self.__count else None,
+            'min': self.__min,
+            'max': self.__max,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99)
+        }
+
+
+class GameMetrics:
+    '''Class representing the per-turn measures of a game.
+
+    Times are in seconds: 'recv' is the time spent waiting for the move of
+    each player, 'applymove' the time spent by the rules engine and
+    'serialize' the time spent building the state messages. The bytes
+    exchanged with each player and their invalid moves are counted as well.
+    '''
+    def __init__(self, nbplayers):
+        self.recv = [Histogram() for i in range(nbplayers)]
+        self.applymove = Histogram()
+        self.serialize = Histogram()
+        self.sent = [0] * nbplayers
+        self.received = [0] * nbplayers
+        self.invalid = [0] * nbplayers
+
+    def todict(self):
+        return {
+            'recv': [histogram.summary() for histogram in self.recv],
+            'applymove': self.applymove.summary(),
+            'serialize': self.serialize.summary(),
+            'sent': list(self.sent),
+            'received': list(self.received),
+            'invalid': list(self.invalid)
+        }
+
+    def tojson(self):
+        return json.dumps(self.todict(), indent=2)
@@ -0,0 +1,175 @@
+# record.py
+# Version: October 17, 2026
+
+import json
+
+
+class GameRecord:
+    '''Class representing the record of a game.
+
+    The 'header' holds what the game needs to rebuild its initial state
+    (see GameServer._recordheader()), 'moves' the received moves as tuples
+    (player, move, valid), in the order they were applied, since a rejected
+    move may have changed the state as well, 'checkpoints' maps turn
+    numbers to pairs (index in 'moves', saved state) (see
+    GameServer._checkpoint()) and 'winner' is the outcome of the game.
+    '''
+    def __init__(self, header, moves=None, checkpoints=None, winner=-1, forfeit=None):
+        self.header = header
+        self.moves = moves if moves is not None else []
+        self.checkpoints = checkpoints if checkpoints is not None else {}
+        self.winner = winner
+        self.forfeit = forfeit
+
+    @property
+    def turns(self):
+        return sum(1 for player, move, valid in self.moves if valid)
+
+    def checkpoint(self, turn):
+        '''Get the latest checkpoint at or before 'turn'.
+
+        Pre: -
+        Post: The returned value is a tuple (turn, index in moves, state),
+              which is (0, 0, None) if there is no such checkpoint.
+        '''
+        best = max((t for t in self.checkpoints if t <= turn), default=None)
+        if best is None:
+            return 0, 0, None
+        return (best,) + tuple(self.checkpoints[best])
+
+    def dumps(self):
+        '''Get the record as one line of JSON.'''
+        return json.dumps({
+            'header': self.header,
+            'moves': self.moves,
+            'checkpoints': {str(turn): state for turn, state in self.checkpoints.items()},
+            'winner': self.winner,
+            'forfeit': self.forfeit
+        }, separators=(',', ':'))
+
+    @classmethod
+    def loads(cls, line):
+        data = json.loads(line)
+        checkpoints = {int(turn): tuple(checkpoint) for turn, checkpoint in data['checkpoints'].items()}
+        return cls(data['header'], [tuple(move) for move in data['moves']], checkpoints,
+                   data['winner'], data['forfeit'])
+
+
+class RecordWriter:
+    '''Class representing an append-only file of game records, one per line.'''
+    def __init__(self, path):
+        self.__path = path
+
+    @property
+    def path(self):
+        return self.__path
+
+    def append(self, record):
+        '''Append a record to the file, which is created if needed.
+
+        Pre: 'record' is a GameRecord
+        Post: The returned value is the offset of the record in the file,
+              to be used with RecordReader.read().
+        '''
+        with open(self.__path, 'ab') as file:
+            offset = file.tell()
+            file.write(record.dumps().encode() + b'\n')
+        return offset
+
+
+class RecordBuffer:
+    '''Class representing an in-memory list of game records.
+
+    It can replace a RecordWriter, to keep the records of the games played
+    in the process instead of appending them to a file.
+    '''
+    def __init__(self):
+        self.records = []
+
+    def append(self, record):
+        '''Append a record to the list.
+
+        Pre: 'record' is a GameRecord
+        Post: The returned value is the index of the record in 'records'.
+        '''
+        self.records.append(record)
+        return len(self.records) - 1
+
+
+class RecordReader:
+    '''Class representing a reader of a file of game records.'''
+    def __init__(self, path):
+        self.__path = path
+
+    def __iter__(self):
+        '''Stream the records of the file, one at a time.'''
+        with open(self.__path, 'rb') as file:
+            for line in file:
+                if line.strip():
+                    yield GameRecord.loads(line)
+
+    def index(self):
+        '''Get the offsets of the records of the file, in order.'''
+        offsets = []
+        with open(self.__path, 'rb') as file:
+            offset = 0
+            for line in file:
+                if line.strip():
+                    offsets.append(offset)
+                offset += len(line)
+        return offsets
+
+    def read(self, offset):
+        '''Read the record at the specified 'offset' (see index()).'''
+        with open(self.__path, 'rb') as file:
+            file.seek(offset)
+            return GameRecord.loads(file.readline())
+
+
+def _replaymoves(server, moves):
+    # Apply the recorded 'moves', generate the 'server' after every valid one
+    for player, move, valid in moves:
+        server._seek(server.turns, player)
+        try:
+            server.applymove(move)
+        except Exception:
+            if valid:
+                raise
+        if valid:
+            server._endturn()
+            yield server
+
+
+def replay(server, record, turn=None):
+    '''Rebuild the state of a recorded game at a given turn.
+
+    Pre: 'server' is a new server of the game, built from the header of
+         'record', 0 <= 'turn' <= record.turns (the end of the game if None)
+    Post: The state of 'server' is the one before the valid move of 'turn'
+          (the final one if 'turn' is record.turns). The moves are replayed
+          from the latest checkpoint at or before 'turn'. The returned
+          value is the 'server'.
+    '''
+    if turn is None:
+        turn = record.turns
+    start, index, checkpoint = record.checkpoint(turn)
+    server._startgame()
+    if checkpoint is not None:
+        server._restore(checkpoint)
+    server._seek(start, record.moves[index][0] if index < len(record.moves) else None)
+    if server.turns < turn:
+        for server in _replaymoves(server, record.moves[index:]):
+            if server.turns == turn:
+                break
+    return server
+
+
+def positions(server, record):
+    '''Replay a whole recorded game, one valid move at a time.
+
+    Pre: 'server' is a new server of the game, built from the header of 'record'
+    Post: The 'server' has been generated after every valid move, its state
+          being the one right after that move.
+    '''
+    server._startgame()
+    yield from _replaymoves(server, record.moves)
@@ -0,0 +1,519 @@
+# search.py
+# Version: October 17, 2026
+
+import random
+import time
+
+EXACT, LOWER, UPPER = range(3)
+
+# Keys of the number of turns left before the horizon, mixed into the keys of
+# the positions: the same position searched with another horizon is another entry
+TURNKEYS = tuple(random.Random(0).getrandbits(64) for i in range(64))
+
+
+class TranspositionTable:
+    '''Class representing a fixed-size transposition table.
+
+    The table is made of buckets of two entries, indexed by the low bits of
+    64-bit position keys. The first entry of a bucket is only replaced by a
+    result searched at least as deep (depth-preferred), the second one is
+    always replaced.
+    '''
+    def __init__(self, size=1 << 18):
+        self.__size = size
+        self.__keys = [None] * (2 * size)
+        self.__entries = [None] * (2 * size)
+        # Stats about the use of the table
+        self.__lookups = 0
+        self.__hits = 0
+
+    @property
+    def size(self):
+        return self.__size
+
+    @property
+    def lookups(self):
+        return self.__lookups
+
+    @property
+    def hits(self):
+        return self.__hits
+
+    def get(self, key):
+        '''Look up a position.
+
+        Pre: 'key' is a 64-bit position key
+        Post: The returned value is a tuple (depth, value, flag, move) stored
+              for the specified 'key', or None if there is none.
+        '''
+        self.__lookups += 1
+        i = 2 * (key % self.__size)
+        keys = self.__keys
+        if keys[i] == key:
+            self.__hits += 1
+            return self.__entries[i]
+        if keys[i + 1] == key:
+            self.__hits += 1
+            return self.__entries[i + 1]
+        return None
+
+    def put(self, key, depth, value, flag=EXACT, move=None):
+        '''Store the result of a search.
+
+        Pre: 'flag' is EXACT, LOWER or UPPER
+        Post: The result has been stored in the depth-preferred entry of the
+              bucket if 'depth' is at least the depth stored there (or if it
+              holds the same 'key'), and in the always-replace entry otherwise.
+        '''
+        i = 2 * (key % self.__size)
+        keys = self.__keys
+        entries = self.__entries
+        if keys[i] is None or keys[i] == key or entries[i][0] <= depth:
+            # Demote the previous depth-preferred entry instead of losing it
+            if keys[i] is not None and keys[i] != key:
+                keys[i + 1], entries[i + 1] = keys[i], entries[i]
+            elif keys[i + 1] == key:
+                keys[i + 1] = entries[i + 1] = None
+            keys[i], entries[i] = key, (depth, value, flag, move)
+        else:
+            keys[i + 1], entries[i + 1] = key, (depth, value, flag, move)
+
+    def clear(self):
+        '''Remove all the entries of the table.'''
+        self.__keys = [None] * (2 * self.__size)
+        self.__entries = [None] * (2 * self.__size)
+        self.__lookups = 0
+        self.__hits = 0
+
+
+class SearchTimeout(Exception):
+    '''Exception raised when a search runs out of time.'''
+    pass
+
+
+class AlphaBetaEngine:
+    '''Class representing an iterative-deepening alpha-beta search engine.
+
+    The engine searches single actions. The searched states must provide
+    the 'player' to move, 'zobrist', choices() (None ending the turn),
+    play(action), undo(), winner() and evaluate(player). The search stops
+    after 'turns' turn changes, since the following card is not known.
+    For the same reason, the engine does not ponder: the positions of its
+    next turn depend on a card drawn after the turn of the opponent.
+    '''
+    WIN = 1 << 20
+
+    def __init__(self, budget=1.0, maxdepth=32, turns=2, table=None):
+        self.__budget = budget
+        self.__maxdepth = maxdepth
+        self.__turns = turns
+        self.__table = table if table is not None else TranspositionTable()
+        # Stats about the last search
+        self.__nodes = 0
+        self.__depth = 0
+
+    @property
+    def budget(self):
+        return self.__budget
+
+    @property
+    def nodes(self):
+        return self.__nodes
+
+    @property
+    def depth(self):
+        return self.__depth
+
+    def nextturn(self, state, timeout=None):
+        '''Search the actions to play for the whole turn of the player to move.
+
+        Pre: 'state' is not a terminal state
+        Post: The returned value is a list of legal actions for the player
+              to move, found within the time budget of the engine, or within
+              'timeout' seconds if it is shorter. The 'state' is left unchanged.
+        '''
+        deadline = time.monotonic() + (self.__budget if timeout is None else min(self.__budget, timeout))
+        player = state.player
+        actions = []
+        try:
+            while state.player == player and state.winner() == -1:
+                # Share the remaining time between the remaining action points
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                points = sum(state.ap) if state.ap is not None else 0
+                action = self.bestaction(state, time.monotonic() + left / (points + 1))
+                if action is None:
+                    break
+                state.play(action)
+                actions.append(action)
+        finally:
+            for action in actions:
+                state.undo()
+        return actions
+
+    def bestaction(self, state, deadline):
+        '''Search the best next action with iterative deepening.
+
+        Pre: 'deadline' is a time.monotonic() timestamp
+        Post: The returned value is the best action found by the deepest
+              search completed before 'deadline' (the first choice if none
+              completed), or None to end the turn.
+        '''
+        choices = state.choices()
+        if len(choices) <= 1:
+            return choices[0] if choices else None
+        best = choices[0]
+        self.__nodes = 0
+        self.__depth = 0
+        player = state.player
+        for depth in range(1, self.__maxdepth + 1):
+            try:
+                value, action = self.__root(state, player, depth, choices, best, deadline)
+            except SearchTimeout:
+                break
+            best = action
+            self.__depth = depth
+            if abs(value) >= AlphaBetaEngine.WIN - self.__maxdepth:
+                break
+        return best
+
+    def __root(self, state, player, depth, choices, first, deadline):
+        # Search the best action of the previous iteration first
+        ordered = [first] + [action for action in choices if action != first]
+        alpha, beta = -AlphaBetaEngine.WIN - 1, AlphaBetaEngine.WIN + 1
+        best = first
+        for action in ordered:
+            state.play(action)
+            try:
+                value = self.__search(state, player, depth - 1, alpha, beta, 1 if action is None else 0, deadline, 1)
+            finally:
+                state.undo()
+            if value > alpha:
+                alpha, best = value, action
+        return alpha, best
+
+    def __search(self, state, player, depth, alpha, beta, turns, deadline, ply):
+        self.__nodes += 1
+        if self.__nodes & 0xff == 0 and time.monotonic() > deadline:
+            raise SearchTimeout()
+        winner = state.winner()
+        if winner != -1:
+            if winner is None:
+                return 0
+            return AlphaBetaEngine.WIN - ply if winner == player else ply - AlphaBetaEngine.WIN
+        if depth == 0 or turns >= self.__turns:
+            return state.evaluate(player)
+        key = state.zobrist ^ TURNKEYS[self.__turns - turns]
+        entry = self.__table.get(key)
+        hint = None
+        if entry is not None:
+            edepth, evalue, eflag, hint = entry
+            if edepth >= depth:
+                if eflag == EXACT:
+                    return evalue
+                if eflag == LOWER and evalue >= beta:
+                    return evalue
+                if eflag == UPPER and evalue <= alpha:
+                    return evalue
+        choices = state.choices()
+        if not choices:
+            return state.evaluate(player)
+        if hint in choices:
+            choices.remove(hint)
+            choices.insert(0, hint)
+        maximizing = state.player == player
+        lower, upper = alpha, beta
+        best = -AlphaBetaEngine.WIN - 1 if maximizing else AlphaBetaEngine.WIN + 1
+        bestaction = None
+        for action in choices:
+            state.play(action)
+            try:
+                value = self.__search(state, player, depth - 1, alpha, beta,
+                                      turns + (action is None), deadline, ply + 1)
+            finally:
+                state.undo()
+            if maximizing and value > best:
+                best, bestaction = value, action
+                alpha = max(alpha, value)
+            elif not maximizing and value < best:
+                best, bestaction = value, action
+                beta = min(beta, value)
+            if alpha >= beta:
+                break
+        if best <= lower:
+            flag = UPPER
+        elif best >= upper:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.__table.put(key, depth, best, flag, bestaction)
+        return best
+
+
+class ExpectimaxEngine:
+    '''Class representing an iterative-deepening expectimax search engine.
+
+    The engine searches single actions like AlphaBetaEngine, but it does
+    not stop at the unknown next card: ending the turn of 'chanceplayer'
+    is a chance node over the distinct outcomes that remain in the deck,
+    weighted by their multiplicity. Chance nodes are pruned with Star1,
+    bounding the outcomes not searched yet by the extreme values, and
+    results are stored in the transposition table under a key combining
+    the position, the sampled hidden information and the multiset of the
+    remaining outcomes.
+
+    Besides what AlphaBetaEngine needs, the searched states must provide
+    determinize(rng), whose deck is then known, 'hiddenzobrist', the hash
+    of the hidden information, remaining(), the list of the outcomes still
+    in the deck, and draw(outcome), ending the turn of 'chanceplayer' with
+    the specified outcome (undone with undo()).
+    '''
+    WIN = AlphaBetaEngine.WIN
+
+    def __init__(self, budget=1.0, maxdepth=32, turns=3, chanceplayer=0, table=None, seed=None):
+        self.__budget = budget
+        self.__maxdepth = maxdepth
+        self.__turns = turns
+        self.__chanceplayer = chanceplayer
+        self.__table = table if table is not None else TranspositionTable()
+        self.__rng = random.Random(seed)
+        # Keys of the multisets of outcomes: one per (outcome, count)
+        self.__keys = {}
+        self.__keyrng = random.Random(0)
+        self.__counts = {}
+        self.__deck = 0
+        # Key of the hidden information of the searched determinization
+        self.__hidden = 0
+        # Event stopping a search while pondering
+        self.__stop = None
+        # Stats about the last search
+        self.__nodes = 0
+        self.__depth = 0
+        self.__chances = 0
+
+    @property
+    def budget(self):
+        return self.__budget
+
+    @property
+    def nodes(self):
+        return self.__nodes
+
+    @property
+    def depth(self):
+        return self.__depth
+
+    @property
+    def chances(self):
+        return self.__chances
+
+    def nextturn(self, state, timeout=None):
+        '''Search the actions to play for the whole turn of the player to move.
+
+        Pre: 'state' is not a terminal state
+        Post: The returned value is a list of legal actions for the player
+              to move, found within the time budget of the engine, or within
+              'timeout' seconds if it is shorter. The search runs on a
+              determinization of 'state', which is left unchanged.
+        '''
+        deadline = time.monotonic() + (self.__budget if timeout is None else min(self.__budget, timeout))
+        state = self.__determinize(state)
+        player = state.player
+        actions = []
+        while state.player == player and state.winner() == -1:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+            points = sum(state.ap) if state.ap is not None else 0
+            action = self.bestaction(state, time.monotonic() + left / (points + 1))
+            if action is None:
+                break
+            state.play(action)
+            actions.append(action)
+        return actions
+
+    def bestaction(self, state, deadline):
+        '''Search the best next action with iterative deepening.
+
+        Pre: 'deadline' is a time.monotonic() timestamp, the outcomes of the
+             deck of 'state' have been counted (see nextturn())
+        Post: The returned value is the best action found by the deepest
+              search completed before 'deadline' (the first choice if none
+              completed), or None to end the turn.
+        '''
+        choices = state.choices()
+        if len(choices) <= 1:
+            return choices[0] if choices else None
+        best = choices[0]
+        self.__nodes = 0
+        self.__depth = 0
+        self.__chances = 0
+        player = state.player
+        for depth in range(1, self.__maxdepth + 1):
+            try:
+                value, action = self.__root(state, player, depth, choices, best, deadline)
+            except SearchTimeout:
+                break
+            best = action
+            self.__depth = depth
+            if abs(value) >= ExpectimaxEngine.WIN - self.__maxdepth:
+                break
+        return best
+
+    def ponder(self, state, stop):
+        '''Search the replies of the opponent, until 'stop' is set.
+
+        Pre: 'state' is the state after the actions of the turn of the player
+             to move, before it ends, 'stop' is a threading.Event
+        Post: The end of the turn (a chance node for 'chanceplayer'), the
+              turn of the opponent and the following turn of the player have
+              been searched with iterative deepening on a determinization of
+              'state', and are kept in the transposition table.
+        '''
+        player = state.player
+        state = self.__determinize(state)
+        self.__stop = stop
+        try:
+            for depth in range(1, self.__maxdepth + 1):
+                # Turns are counted from the end of the turn of the opponent,
+                # so that the next search finds its positions with the same horizon
+                self.__child(state, player, None, depth, -ExpectimaxEngine.WIN - 1, ExpectimaxEngine.WIN + 1, -2,
+                             float('inf'), 1)
+        except SearchTimeout:
+            pass
+        finally:
+            self.__stop = None
+
+    def advance(self, actions):
+        '''Tell the engine the actions played by the opponent since the last turn.
+
+        Nothing has to be done: the pondered positions are in the table.
+        '''
+        pass
+
+    def __determinize(self, state):
+        # Determinize the state and count the outcomes left in its deck
+        state = state.determinize(self.__rng)
+        self.__hidden = state.hiddenzobrist
+        self.__counts = {}
+        self.__deck = 0
+        for outcome in state.remaining():
+            self.__count(outcome, 1)
+        return state
+
+    def __count(self, outcome, n):
+        # Change the count of an outcome, updating the key of the multiset
+        keys = self.__keys
+        old = self.__counts.get(outcome, 0)
+        for count in (old, old + n):
+            if (outcome, count) not in keys:
+                keys[outcome, count] = self.__keyrng.getrandbits(64)
+        self.__deck ^= keys[outcome, old] ^ keys[outcome, old + n]
+        self.__counts[outcome] = old + n
+
+    def __root(self, state, player, depth, choices, first, deadline):
+        # Search the best action of the previous iteration first
+        ordered = [first] + [action for action in choices if action != first]
+        alpha, beta = -ExpectimaxEngine.WIN - 1, ExpectimaxEngine.WIN + 1
+        best = first
+        for action in ordered:
+            value = self.__child(state, player, action, depth - 1, alpha, beta, 0, deadline, 1)
+            if value > alpha:
+                alpha, best = value, action
+        return alpha, best
+
+    def __child(self, state, player, action, depth, alpha, beta, turns, deadline, ply):
+        # Search the state after 'action', through a chance node if it ends
+        # the turn of the chance player and the search goes on after it
+        if action is None:
+            turns += 1
+            if state.player == self.__chanceplayer and turns < self.__turns and depth > 0:
+                return self.__chance(state, player, depth, alpha, beta, turns, deadline, ply)
+        state.play(action)
+        try:
+            return self.__search(state, player, depth, alpha, beta, turns, deadline, ply)
+        finally:
+            state.undo()
+
+    def __chance(self, state, player, depth, alpha, beta, turns, deadline, ply):
+        self.__chances += 1
+        win = ExpectimaxEngine.WIN
+        # The most likely outcomes first, to tighten the bounds early
+        outcomes = sorted(((n, outcome) for outcome, n in self.__counts.items() if n > 0), reverse=True)
+        total = sum(n for n, outcome in outcomes)
+        left = total
+        expected = 0.0
+        for n, outcome in outcomes:
+            p = n / total
+            left -= n
+            rest = left / total
+            # Window of the outcome for the chance node to stay in (alpha, beta)
+            a = max(-win - 1, (alpha - expected - rest * win) / p)
+            b = min(win + 1, (beta - expected + rest * win) / p)
+            self.__count(outcome, -1)
+            state.draw(outcome)
+            try:
+                value = self.__search(state, player, depth, a, b, turns, deadline, ply)
+            finally:
+                state.undo()
+                self.__count(outcome, 1)
+            if value <= a:
+                return expected + p * value + rest * win
+            if value >= b:
+                return expected + p * value - rest * win
+            expected += p * value
+        return expected
+
+    def __search(self, state, player, depth, alpha, beta, turns, deadline, ply):
+        self.__nodes += 1
+        if self.__nodes & 0xff == 0 and (time.monotonic() > deadline
+                                         or self.__stop is not None and self.__stop.is_set()):
+            raise SearchTimeout()
+        winner = state.winner()
+        if winner != -1:
+            if winner is None:
+                return 0
+            return ExpectimaxEngine.WIN - ply if winner == player else ply - ExpectimaxEngine.WIN
+        if depth == 0 or turns >= self.__turns:
+            return state.evaluate(player)
+        key = state.zobrist ^ self.__hidden ^ self.__deck ^ TURNKEYS[self.__turns - turns]
+        entry = self.__table.get(key)
+        hint = None
+        if entry is not None:
+            edepth, evalue, eflag, hint = entry
+            if edepth >= depth:
+                if eflag == EXACT:
+                    return evalue
+                if eflag == LOWER and evalue >= beta:
+                    return evalue
+                if eflag == UPPER and evalue <= alpha:
+                    return evalue
+        choices = state.choices()
+        if not choices:
+            return state.evaluate(player)
+        if hint in choices:
+            choices.remove(hint)
+            choices.insert(0, hint)
+        maximizing = state.player == player
+        lower, upper = alpha, beta
+        best = -ExpectimaxEngine.WIN - 1 if maximizing else ExpectimaxEngine.WIN + 1
+        bestaction = None
+        for action in choices:
+            value = self.__child(state, player, action, depth - 1, alpha, beta, turns, deadline, ply + 1)
+            if maximizing and value > best:
+                best, bestaction = value, action
+                alpha = max(alpha, value)
+            elif not maximizing and value < best:
+                best, bestaction = value, action
+                beta = min(beta, value)
+            if alpha >= beta:
+                break
+        if best <= lower:
+            flag = UPPER
+        elif best >= upper:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.__table.put(key, depth, best, flag, bestaction)
+        return best
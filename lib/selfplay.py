@@ -0,0 +1,71 @@
+# selfplay.py
+# Version: October 17, 2026
+
+import multiprocessing
+
+
+def playgame(factory, seed):
+    '''Play one game in-process.
+
+    Pre: 'factory' is a picklable callable such that factory(seed) returns
+         a pair (server, players), with players created without a server
+    Post: The returned value is a dictionary with the 'seed', the 'winner',
+          the number of 'turns' and the player who forfeited, if any. The
+          players have been closed (see GameClient.close()).
+    '''
+    server, players = factory(seed)
+    try:
+        winner = server.playlocal(players)
+    finally:
+        for player in players:
+            player.close()
+    return {'seed': seed, 'winner': winner, 'turns': server.turns, 'forfeit': server.forfeit}
+
+
+def _playgame(job):
+    return playgame(*job)
+
+
+def playgames(factory, games, workers=1, seed=0, nbplayers=2):
+    '''Play games in-process and aggregate their results.
+
+    Pre: 'factory' is as for playgame(), 'games' >= 1
+    Post: 'games' games have been played with seeds seed, seed + 1, ...,
+          spread over 'workers' processes. The returned value is a dictionary
+          with the number of 'games', the 'wins' of each player, the 'draws',
+          the 'forfeits' and the 'turns' statistics (min, mean, max).
+    '''
+    stats = {
+        'games': 0,
+        'wins': [0] * nbplayers,
+        'draws': 0,
+        'forfeits': 0,
+        'turns': {'min': None, 'mean': 0.0, 'max': None}
+    }
+    jobs = [(factory, seed + i) for i in range(games)]
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap_unordered(_playgame, jobs, chunksize=max(1, games // (8 * workers)))
+    else:
+        pool = None
+        results = map(_playgame, jobs)
+    try:
+        total = 0
+        for result in results:
+            stats['games'] += 1
+            if result['winner'] is None:
+                stats['draws'] += 1
+            else:
+                stats['wins'][result['winner']] += 1
+            if result['forfeit'] is not None:
+                stats['forfeits'] += 1
+            turns = result['turns']
+            total += turns
+            stats['turns']['min'] = turns if stats['turns']['min'] is None else min(stats['turns']['min'], turns)
+            stats['turns']['max'] = turns if stats['turns']['max'] is None else max(stats['turns']['max'], turns)
+        stats['turns']['mean'] = total / max(1, stats['games'])
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return stats
@@ -0,0 +1,168 @@
+# tournament.py
+# Version: October 17, 2026
+
+import json
+import math
+import multiprocessing
+
+
+def roundrobin(entrants):
+    '''Get the pairings of one round of a round-robin tournament.
+
+    Pre: 'entrants' is a list of at least two names
+    Post: The returned value is a list of pairs (player 0, player 1) where
+          every two entrants meet twice, once on each side.
+    '''
+    return [(a, b) for a in entrants for b in entrants if a != b]
+
+
+def swiss(entrants, scores, opponents):
+    '''Get the pairings of the next round of a Swiss tournament.
+
+    Pre: 'scores' maps every entrant to its score so far, 'opponents' maps
+         every entrant to the set of the entrants it already met
+    Post: The returned value is a list of pairs (player 0, player 1), two
+          per match, one on each side. The entrants are sorted by score and
+          every one meets the next one it has not met yet, if any. With an
+          odd number of entrants, the last one is not paired (bye).
+    '''
+    waiting = sorted(entrants, key=lambda name: -scores[name])
+    pairings = []
+    while len(waiting) >= 2:
+        a = waiting.pop(0)
+        b = next((name for name in waiting if name not in opponents[a]), waiting[0])
+        waiting.remove(b)
+        pairings += [(a, b), (b, a)]
+    return pairings
+
+
+class Elo:
+    '''Class representing Elo ratings, updated incrementally after every game.
+
+    The confidence interval of a rating is derived from the score of the
+    player over its games, whose standard error is converted to Elo points
+    around the current rating.
+    '''
+    def __init__(self, entrants, k=16, initial=1500):
+        self.__k = k
+        self.__ratings = {name: float(initial) for name in entrants}
+        self.__results = {name: [0, 0, 0] for name in entrants}
+
+    def rating(self, name):
+        return self.__ratings[name]
+
+    def expected(self, a, b):
+        '''Get the expected score of 'a' against 'b'.'''
+        return 1 / (1 + 10 ** ((self.__ratings[b] - self.__ratings[a]) / 400))
+
+    def update(self, a, b, score):
+        '''Record a game between 'a' and 'b'.
+
+        Pre: 'score' is the score of 'a': 1 for a win, 0.5 for a draw and 0
+             for a loss
+        Post: The ratings of 'a' and 'b' have been updated.
+        '''
+        delta = self.__k * (score - self.expected(a, b))
+        self.__ratings[a] += delta
+        self.__ratings[b] -= delta
+        for name, result in ((a, score), (b, 1 - score)):
+            self.__results[name][0 if result == 1 else 1 if result == 0.5 else 2] += 1
+
+    def interval(self, name, z=1.96):
+        '''Get the confidence interval (low, high) of the rating of 'name'.
+
+        Pre: 'z' is the quantile of the normal distribution (1.96 for 95%)
+        Post: The returned value is (None, None) if 'name' played no game.
+        '''
+        wins, draws, losses = self.__results[name]
+        games = wins + draws + losses
+        if games == 0:
+            return None, None
+        score = (wins + draws / 2) / games
+        # Keep the score away from 0 and 1, where the interval is infinite
+        score = min(max(score, 1 / (2 * games)), 1 - 1 / (2 * games))
+        variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+        error = math.sqrt(variance / games)
+        margin = z * 400 / math.log(10) * error / (score * (1 - score))
+        rating = self.__ratings[name]
+        return rating - margin, rating + margin
+
+    def standings(self):
+        '''Get the standings as a list of dictionaries, best rating first.'''
+        result = []
+        for name in sorted(self.__ratings, key=lambda name: -self.__ratings[name]):
+            wins, draws, losses = self.__results[name]
+            low, high = self.interval(name)
+            result.append({'name': name, 'elo': round(self.__ratings[name], 1),
+                           'interval': [None if low is None else round(low, 1), None if high is None else round(high, 1)],
+                           'wins': wins, 'draws': draws, 'losses': losses})
+        return result
+
+
+def playmatch(factory, seed, pairing):
+    '''Play one game of a tournament in-process.
+
+    Pre: 'factory' is a picklable callable such that factory(seed, pairing)
+         returns a pair (server, players), with players created without a
+         server, where 'pairing' is the pair of entrants (player 0, player 1)
+    Post: The returned value is a dictionary with the 'seed', the 'players',
+          the 'winner' (0, 1 or None), the number of 'turns' and the player
+          who forfeited, if any. The players have been closed (see
+          GameClient.close()).
+    '''
+    server, players = factory(seed, pairing)
+    try:
+        winner = server.playlocal(players)
+    finally:
+        for player in players:
+            player.close()
+    return {'seed': seed, 'players': list(pairing), 'winner': winner, 'turns': server.turns, 'forfeit': server.forfeit}
+
+
+def _playmatch(job):
+    return playmatch(*job)
+
+
+def run(factory, entrants, rounds=1, system='roundrobin', workers=1, seed=0, output=None, k=16):
+    '''Play a tournament.
+
+    Pre: 'factory' is as for playmatch(), 'system' is 'roundrobin' or
+         'swiss', 'output' is None or a writable text file
+    Post: 'rounds' rounds have been played, the games of a round being
+          spread over 'workers' processes, with seeds seed, seed + 1, ...
+          (one per match, shared by its two games with swapped sides).
+          Every result has been written to 'output' as one JSON object per
+          line, as soon as it was known. The returned value is the Elo
+          instance with the final ratings.
+    '''
+    elo = Elo(entrants, k=k)
+    scores = {name: 0.0 for name in entrants}
+    opponents = {name: set() for name in entrants}
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        for number in range(rounds):
+            pairings = roundrobin(entrants) if system == 'roundrobin' else swiss(entrants, scores, opponents)
+            # Both sides of a match are played with the same seed
+            seeds = {}
+            for pairing in pairings:
+                seeds.setdefault(frozenset(pairing), seed + len(seeds))
+            seed += len(seeds)
+            jobs = [(factory, seeds[frozenset(pairing)], pairing) for pairing in pairings]
+            results = pool.imap_unordered(_playmatch, jobs) if pool is not None else map(_playmatch, jobs)
+            for result in results:
+                a, b = result['players']
+                score = 0.5 if result['winner'] is None else float(result['winner'] == 0)
+                elo.update(a, b, score)
+                scores[a] += score
+                scores[b] += 1 - score
+                opponents[a].add(b)
+                opponents[b].add(a)
+                if output is not None:
+                    result['round'] = number
+                    output.write(json.dumps(result) + '\n')
+                    output.flush()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return elo
@@ -0,0 +1,334 @@
+# test_protocol.py
+# Version: October 17, 2026
+
+import asyncio
+import random
+import socket
+import threading
+import time
+
+import pytest
+
+import kingandassassins as ka
+from lib import clock
+from lib import game
+from lib import record
+from lib import tournament
+
+SEEDS = range(8)
+
+
+def _turns(seed):
+    # Generate the state of the server after every turn of a random game
+    rng = random.Random(seed)
+    state = ka.KingAndAssassinsServer(seed=seed)._state
+    state.setassassins(rng.sample(sorted(ka.POPULATION), 3))
+    state.update([], 0)
+    while state.winner() == -1:
+        yield state
+        # Choose the actions of the turn on a copy, as a client would
+        search = state.copy()
+        player = search.player
+        actions = []
+        while search.player == player and search.winner() == -1:
+            action = rng.choice(search.choices())
+            if action is None:
+                break
+            search.play(action)
+            actions.append(action)
+        state.update(actions, player)
+    yield state
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_delta_roundtrip(seed):
+    client = snapshot = None
+    for number, state in enumerate(_turns(seed)):
+        if client is None:
+            client = ka.KingAndAssassinsState.parse(str(state))
+        # A player receives the state every other turn, as a delta
+        elif number % 2 == 0 or state.winner() != -1:
+            client.applydelta(state.delta(snapshot))
+            assert str(client) == str(state)
+        else:
+            continue
+        snapshot = state.snapshot()
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_encode_roundtrip(seed):
+    for state in _turns(seed):
+        data = state.encode()
+        decoded = ka.KingAndAssassinsState.decode(data)
+        assert str(decoded) == str(state)
+        assert decoded.encode() == data
+        assert decoded.zobrist == ka.KingAndAssassinsState.parse(str(state)).zobrist
+
+
+def _frame(payload):
+    return game.Connection.HEADER.pack(len(payload)) + payload
+
+
+def _sendslowly(sock, data, chunk):
+    # Send 'data' in chunks of 'chunk' bytes, so that they are received separately
+    for i in range(0, len(data), chunk):
+        sock.sendall(data[i:i + chunk])
+        time.sleep(0.001)
+
+
+@pytest.mark.parametrize('chunk', [1, 3, 7, 4096])
+def test_connection_reassembles_frames(chunk):
+    messages = [b'PLAY {}', b'x' * 1000, b'', 'café'.encode(), bytes(range(256))]
+    left, right = socket.socketpair()
+    connection = game.Connection(right, buffersize=16)
+    sender = threading.Thread(target=_sendslowly, args=(left, b''.join(_frame(m) for m in messages), chunk))
+    sender.start()
+    try:
+        received = [connection.recv(binary=True) for message in messages]
+    finally:
+        sender.join()
+        left.close()
+        connection.close()
+    assert received == messages
+
+
+def test_connection_send_recv():
+    left, right = socket.socketpair()
+    a, b = game.Connection(left), game.Connection(right)
+    try:
+        a.send('START 0 delta,binary')
+        a.send(b'BINARY \x00\xff')
+        assert b.recv() == 'START 0 delta,binary'
+        assert b.recv(binary=True) == b'BINARY \x00\xff'
+        assert a.sent == b.received
+    finally:
+        a.close()
+        b.close()
+
+
+def test_connection_timeout_keeps_partial_frame():
+    left, right = socket.socketpair()
+    connection = game.Connection(right)
+    data = _frame(b'{"actions":[]}')
+    try:
+        left.sendall(data[:6])
+        with pytest.raises(TimeoutError):
+            connection.recv(timeout=0.05)
+        left.sendall(data[6:])
+        assert connection.recv(timeout=1) == '{"actions":[]}'
+    finally:
+        left.close()
+        connection.close()
+
+
+def test_async_connection_timeout_keeps_partial_frame():
+    async def run():
+        left, right = socket.socketpair()
+        reader, writer = await asyncio.open_connection(sock=right)
+        connection = game.AsyncConnection(reader, writer)
+        data = _frame(b'{"actions":[]}')
+        try:
+            left.sendall(data[:6])
+            with pytest.raises(asyncio.TimeoutError):
+                await connection.recv(0.05)
+            left.sendall(data[6:] + _frame(b'REMATCH'))
+            assert await connection.recv(1) == '{"actions":[]}'
+            assert await connection.recv(1) == 'REMATCH'
+        finally:
+            left.close()
+            await connection.close()
+    asyncio.run(run())
+
+
+def test_batchsim_matches_rules():
+    pytest.importorskip('numpy')
+    import batchsim
+    assert batchsim.check(games=64, seed=0) == []
+
+
+class _Engine:
+    # An engine playing the same turn every time, or raising 'error'
+    def __init__(self, actions=(), error=None):
+        self.__actions = list(actions)
+        self.__error = error
+        self.calls = 0
+
+    def nextturn(self, state, timeout=None):
+        self.calls += 1
+        if self.__error is not None:
+            raise self.__error
+        return self.__actions
+
+
+def _localgame(engine, retries=3):
+    server = ka.KingAndAssassinsServer(seed=0, retries=retries)
+    players = [ka.KingAndAssassinsClient('player0', None, engine=ka.makeengine('alphabeta', 0.01)),
+               ka.KingAndAssassinsClient('player1', None, engine=engine)]
+    return server, players
+
+
+def test_playlocal_forfeits_after_retries():
+    engine = _Engine([('attack', 0, 0, 'N')])
+    server, players = _localgame(engine, retries=2)
+    assert server.playlocal(players) == 0
+    assert server.forfeit == 1
+    assert engine.calls == 3
+
+
+def test_playlocal_propagates_player_errors():
+    server, players = _localgame(_Engine(error=ZeroDivisionError('bug')))
+    with pytest.raises(ZeroDivisionError):
+        server.playlocal(players)
+
+
+def _recordedgame(seed):
+    # Play a quick game between two engines, keeping its record in memory
+    recorder = record.RecordBuffer()
+    server = ka.KingAndAssassinsServer(seed=seed, recorder=recorder)
+    players = [ka.KingAndAssassinsClient('player0', None, engine=ka.makeengine('alphabeta', 0.005)),
+               ka.KingAndAssassinsClient('player1', None, engine=ka.makeengine('alphabeta', 0.005))]
+    server.playlocal(players)
+    return server, recorder.records[0]
+
+
+def test_positions_match_replay():
+    server, game_record = _recordedgame(0)
+    header = game_record.header
+    for turn, position in enumerate(record.positions(ka.KingAndAssassinsServer.fromrecord(header), game_record), 1):
+        replayed = record.replay(ka.KingAndAssassinsServer.fromrecord(header), game_record, turn)
+        assert str(position._state) == str(replayed._state)
+    assert turn == game_record.turns == server.turns
+    assert str(position._state) == str(server._state)
+
+
+def test_clock_bank_and_increment():
+    control = clock.TimeControl.parse('fischer:10+2')
+    assert str(control) == 'fischer:10+2'
+    timer = clock.Clock(control, 2)
+    assert not timer.spend(0, 4)
+    timer.moved(0)
+    assert timer.left(0) == 8 and timer.left(1) == 10
+    assert timer.spend(0, 9)
+    assert timer.allowed(0) == 0
+
+
+def test_clock_move_limit():
+    timer = clock.Clock(clock.TimeControl.parse('move:1'), 2)
+    assert timer.left(0) is None
+    assert not timer.spend(0, 0.5)
+    assert timer.spend(1, 1.5)
+    with pytest.raises(ValueError):
+        clock.TimeControl.parse('move:')
+
+
+def test_playlocal_flags_slow_player():
+    class SlowEngine(_Engine):
+        def nextturn(self, state, timeout=None):
+            time.sleep(0.05)
+            return super().nextturn(state, timeout)
+    server = ka.KingAndAssassinsServer(seed=0, timecontrol=clock.TimeControl.parse('move:0.02'))
+    players = [ka.KingAndAssassinsClient('player0', None, engine=_Engine()),
+               ka.KingAndAssassinsClient('player1', None, engine=SlowEngine())]
+    assert server.playlocal(players) == 0
+    assert server.forfeit == 1
+
+
+def _freeport():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _connect(port, games, results):
+    # Play as a client of the server on 'port', from a thread
+    def play(name):
+        ka.KingAndAssassinsClient(name, ('127.0.0.1', port), engine=ka.makeengine('alphabeta', 0.002), games=games)
+        results.append(name)
+    threads = [threading.Thread(target=play, args=('player{}'.format(i),)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def test_session_rematches():
+    finished = []
+    server = ka.KingAndAssassinsServer(seed=0, games=3, onfinish=lambda server: finished.append(server.forfeit))
+    port = _freeport()
+    serving = threading.Thread(target=server.run, args=('127.0.0.1', port))
+    serving.start()
+    time.sleep(0.2)
+    results = []
+    for thread in _connect(port, None, results):
+        thread.join(60)
+    serving.join(60)
+    assert server.played == 3
+    assert finished == [None] * 3
+    assert sorted(results) == ['player0', 'player1']
+
+
+def test_lobby_session():
+    finished = []
+    lobby = game.AsyncGameServer(lambda: ka.KingAndAssassinsServer(seed=0, games=2), 2,
+                                 onfinish=lambda number, server: finished.append((number, server.played)))
+    port = _freeport()
+    loop = asyncio.new_event_loop()
+    serving = loop.create_task(lobby.serve('127.0.0.1', port))
+    thread = threading.Thread(target=loop.run_until_complete, args=(asyncio.wait([serving]),))
+    thread.start()
+    try:
+        time.sleep(0.2)
+        results = []
+        # The first pair plays a session of two games, the second one a single game
+        clients = _connect(port, None, results)
+        time.sleep(0.2)
+        clients += _connect(port, 1, results)
+        for client in clients:
+            client.join(60)
+        for i in range(100):
+            if len(finished) == 3:
+                break
+            time.sleep(0.05)
+    finally:
+        loop.call_soon_threadsafe(serving.cancel)
+        thread.join(10)
+        loop.close()
+    assert len(results) == 4
+    assert sorted(finished) == [(0, 1), (0, 2), (1, 1)]
+    assert lobby.played == 3
+
+
+def test_elo_update():
+    elo = tournament.Elo(['a', 'b', 'c'], k=16)
+    assert elo.expected('a', 'b') == 0.5
+    elo.update('a', 'b', 1)
+    assert (elo.rating('a'), elo.rating('b')) == (1508, 1492)
+    assert elo.expected('a', 'b') + elo.expected('b', 'a') == pytest.approx(1)
+    elo.update('b', 'c', 0.5)
+    assert elo.rating('b') > 1492 and elo.rating('c') < 1500
+    assert elo.rating('a') + elo.rating('b') + elo.rating('c') == pytest.approx(4500)
+    low, high = elo.interval('a')
+    assert low < elo.rating('a') < high
+    standings = elo.standings()
+    assert [entry['name'] for entry in standings] == ['a', 'c', 'b']
+    assert [(entry['wins'], entry['draws'], entry['losses']) for entry in standings] == [(1, 0, 0), (0, 1, 0), (0, 1, 1)]
+
+
+def test_record_roundtrip(tmp_path):
+    server, game_record = _recordedgame(1)
+    assert game_record.checkpoints
+    writer = record.RecordWriter(str(tmp_path / 'games.jsonl'))
+    offsets = [writer.append(game_record), writer.append(_recordedgame(2)[1])]
+    reader = record.RecordReader(writer.path)
+    assert reader.index() == offsets
+    loaded = reader.read(offsets[0])
+    assert loaded.dumps() == game_record.dumps()
+    assert [r.dumps() for r in reader][0] == game_record.dumps()
+    # Replaying from the checkpoints gives the same states as from the start
+    stripped = record.GameRecord(loaded.header, loaded.moves, winner=loaded.winner, forfeit=loaded.forfeit)
+    for turn in range(0, loaded.turns + 1, 7):
+        fast = record.replay(ka.KingAndAssassinsServer.fromrecord(loaded.header), loaded, turn)
+        slow = record.replay(ka.KingAndAssassinsServer.fromrecord(loaded.header), stripped, turn)
+        assert str(fast._state) == str(slow._state)
+    final = record.replay(ka.KingAndAssassinsServer.fromrecord(loaded.header), loaded)
+    assert str(final._state) == str(server._state)
+    assert final._state.winner() == loaded.winner
@@ -0,0 +1,228 @@
+# test_state.py
+# Version: October 17, 2026
+
+import json
+import random
+
+import pytest
+
+import kingandassassins as ka
+from lib import game
+
+SEEDS = range(12)
+
+
+def _setup(seed):
+    # A server state with random assassins, once the first card is drawn
+    state = ka.KingAndAssassinsServer(seed=seed)._state
+    state.setassassins(random.Random(seed).sample(sorted(ka.POPULATION), 3))
+    state.update([], 0)
+    return state
+
+
+def _fingerprint(state):
+    # Everything play() and undo() may change
+    return (bytes(state._people), list(state._masks), state.player, state.ap, state.zobrist,
+            json.dumps(state._state['visible'], sort_keys=True), list(state._state['hidden']['cards']))
+
+
+def _scratch(state):
+    # The masks and the hash of the state, recomputed from the people
+    masks = [0] * len(ka.CLASSES)
+    h = state._scalarhash()
+    for i, code in enumerate(state._people):
+        if code:
+            masks[ka.CLASSOF[code]] |= 1 << i
+        h ^= ka.ZOBRIST_PEOPLE[i][code]
+    return masks, h
+
+
+def _randomgame(seed, steps=400):
+    # Generate the states along a random game, the chosen action being played after
+    rng = random.Random(seed)
+    state = _setup(seed)
+    for step in range(steps):
+        if state.winner() != -1:
+            break
+        choices = state.choices()
+        # Prefer the captures, to reach the arrests, kills and attacks, and
+        # end the turn one time out of four to keep games of realistic length
+        captures = [action for action in choices if action is not None and action[0] != 'move']
+        if captures and rng.random() < 0.5:
+            action = rng.choice(captures)
+        else:
+            action = None if rng.random() < 0.25 else rng.choice(choices)
+        yield state, choices, rng
+        state.play(action)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_play_undo_restores_state(seed):
+    for state, choices, rng in _randomgame(seed):
+        before = _fingerprint(state)
+        for action in rng.sample(choices, min(4, len(choices))):
+            state.play(action)
+            state.undo()
+            assert _fingerprint(state) == before
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_undo_whole_game(seed):
+    initial = None
+    played = 0
+    for state, choices, rng in _randomgame(seed):
+        if initial is None:
+            initial = _fingerprint(state)
+        played += 1
+    for i in range(played):
+        state.undo()
+    assert _fingerprint(state) == initial
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_incremental_hash(seed):
+    for state, choices, rng in _randomgame(seed):
+        assert _scratch(state) == (state._masks, state.zobrist)
+        state.play(rng.choice(choices))
+        assert _scratch(state) == (state._masks, state.zobrist)
+        state.undo()
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_rejected_action_leaves_state(seed):
+    for state, choices, rng in _randomgame(seed, steps=100):
+        before = _fingerprint(state)
+        with pytest.raises(game.InvalidMoveException):
+            state.play(('attack', 0, 0, 'N'))
+        assert _fingerprint(state) == before
+
+
+
+def _position(people, player, king='healthy'):
+    # A state with the specified people, placed as {(x, y): name}, with 'player' to move
+    grid = [[None] * 10 for i in range(10)]
+    for (x, y), name in people.items():
+        grid[x][y] = name
+    visible = dict(ka.KA_INITIAL_STATE, people=grid, card=(1, 6, True, 5), king=king)
+    state = ka.KingAndAssassinsState(visible, {'assassins': {'monk'}, 'cards': list(ka.CARDS)})
+    state.player = player
+    return state
+
+
+@pytest.mark.parametrize('people, player, action, king', [
+    ({(5, 1): 'knight', (5, 2): 'monk'}, 1, ('arrest', 5, 1, 'E'), 'healthy'),
+    ({(5, 1): 'knight', (5, 2): 'assassin'}, 1, ('kill', 5, 1, 'E'), 'healthy'),
+    ({(5, 1): 'knight', (5, 2): 'assassin'}, 0, ('kill', 5, 2, 'W'), 'healthy'),
+    ({(9, 8): 'assassin'}, 0, ('attack', 9, 8, 'E'), 'healthy'),
+    ({(9, 8): 'assassin'}, 0, ('attack', 9, 8, 'E'), 'injured'),
+    ({(5, 2): 'monk'}, 0, ('reveal', 5, 2), 'healthy'),
+    ({(5, 0): 'knight', (5, 1): 'monk', (5, 2): 'farmer'}, 1, ('move', 5, 0, 'E'), 'healthy'),
+])
+def test_captures(people, player, action, king):
+    state = _position({(9, 9): 'king', **people}, player, king)
+    before = _fingerprint(state)
+    state.play(action)
+    assert _fingerprint(state) != before
+    assert _scratch(state) == (state._masks, state.zobrist)
+    state.undo()
+    assert _fingerprint(state) == before
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_moves_leave_state(seed):
+    state = _setup(seed)
+    before = _fingerprint(state)
+    player = state.player
+    generator = state.moves(player)
+    for number, sequence in zip(range(300), generator):
+        # Every sequence is legal from the unchanged state
+        assert _fingerprint(state) == before
+        copy = state.copy()
+        copy.update(sequence, player)
+        if sequence:
+            state.play(sequence[0])
+            state.undo()
+    # Stopping the generation, while still holding it, leaves the state unchanged
+    assert number == 299
+    assert _fingerprint(state) == before
+    generator.close()
+    assert _fingerprint(state) == before
+
+
+def test_door_distances_avoid_roofs():
+    # The king cannot stand on the roof west of the castle, so it is no door
+    distances = ka.DOORDISTANCES
+    assert distances[22] == 0
+    assert distances[40] == ka.UNREACHABLE
+    assert (distances[41], distances[32], distances[50]) == (3, 1, 5)
+    assert all(distances[i] == ka.UNREACHABLE for i in range(100) if ka.ROOF >> i & 1)
+
+
+def test_hidden_zobrist_tells_determinizations_apart():
+    state = ka.KingAndAssassinsState.parse(str(_setup(0)))
+    assert state.hiddenzobrist == 0
+    rng = random.Random(0)
+    seen = {}
+    for i in range(50):
+        determinization = state.determinize(rng)
+        assassins = frozenset(determinization._state['hidden']['assassins'])
+        assert seen.setdefault(assassins, determinization.hiddenzobrist) == determinization.hiddenzobrist
+        assert determinization.zobrist == state.zobrist
+    assert len(set(seen.values())) == len(seen) > 1
+
+
+@pytest.mark.parametrize('assassins, engine', [
+    ('alphabeta', 'expectimax'),
+    ('expectimax', 'ismcts'),
+    ('ismcts', 'alphabeta'),
+])
+def test_engines_play_legal_turns(assassins, engine):
+    # Every turn sent by the clients is checked by the rules of the server
+    server = ka.KingAndAssassinsServer(seed=3, retries=0)
+    players = [ka.KingAndAssassinsClient('player0', None, engine=ka.makeengine(assassins, 0.01, 20)),
+               ka.KingAndAssassinsClient('player1', None, engine=ka.makeengine(engine, 0.01, 20))]
+    try:
+        server.playlocal(players)
+    finally:
+        for player in players:
+            player.close()
+    assert server.forfeit is None
+    assert server.metrics.invalid == [0, 0]
+    assert server._state.winner() != -1
+
+
+def _beliefposition(moves=(), gone=(), arrested=()):
+    # The villagers on rows 5 and 7, the king in (9, 9), after the specified moves
+    names = sorted(ka.POPULATION)
+    cells = [(5, y) for y in range(10)] + [(7, 0), (7, 1)]
+    people = {cell: name for cell, name in zip(cells, names) if name not in gone}
+    for name, (x, y, direction) in moves:
+        cell = next(cell for cell, other in people.items() if other == name)
+        del people[cell]
+        people[x + (direction == 'S'), y] = name
+    state = _position({(9, 9): 'king', **people}, 1)
+    visible = state._state['visible']
+    visible['lastopponentmove'] = [('move', x, y, direction) for name, (x, y, direction) in moves]
+    visible['arrested'] = list(arrested)
+    return state
+
+
+def test_belief_favours_approaching_villagers():
+    belief = ka.AssassinBelief()
+    assert belief.marginals() == pytest.approx({name: 0.25 for name in ka.POPULATION})
+    belief.observe(_beliefposition(moves=[('monk', (5, 3, 'S'))]))
+    marginals = belief.marginals()
+    assert sum(marginals.values()) == pytest.approx(3)
+    assert marginals['monk'] == max(marginals.values()) > 0.25
+    assert belief.probability('monk') == pytest.approx(marginals['monk'])
+
+
+def test_belief_rules_out_with_reveals_and_arrests():
+    belief = ka.AssassinBelief()
+    belief.observe(_beliefposition())
+    # A villager gone without being arrested has been revealed as an assassin
+    belief.observe(_beliefposition(gone=['monk', 'farmer'], arrested=['farmer']))
+    assert belief.probability('monk') == pytest.approx(1)
+    assert belief.probability('farmer') < 1
+    rng = random.Random(0)
+    assert all('monk' in belief.sample(rng) for i in range(100))
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# trainingdata.py
+# Version: October 17, 2026
+
+import argparse
+import multiprocessing
+import os
+
+import numpy as np
+
+import kingandassassins as ka
+from lib import record
+
+# Feature planes: one per class of pawns (see ka.CLASSES), then the roofs
+PLANES = len(ka.CLASSES) + 1
+# Scalar features: king's status (one-hot), killed knights and assassins,
+# arrested villagers, card (king AP, knights AP, fetter, assassins AP) and
+# player to move
+SCALARS = 3 + 3 + 4 + 1
+
+_CLASSOF = np.full(len(ka.PAWNS), 255, dtype=np.uint8)
+_CLASSOF[1:] = np.frombuffer(ka.CLASSOF[1:], dtype=np.uint8)
+_ROOF = np.array([ka.ROOF >> i & 1 for i in range(100)], dtype=np.uint8)
+_KINGSTATUS = {status: i for i, status in enumerate(ka.KINGSTATUS)}
+
+
+def encode(states):
+    '''Encode a batch of states as feature arrays.
+
+    Pre: 'states' is a non-empty list of KingAndAssassinsState with a card
+    Post: The returned value is a pair (planes, scalars) of arrays of shapes
+          (N, PLANES, 10, 10) uint8 and (N, SCALARS) float32.
+    '''
+    n = len(states)
+    people = np.frombuffer(b''.join(bytes(state._people) for state in states), dtype=np.uint8).reshape(n, 100)
+    classes = _CLASSOF[people]
+    planes = np.empty((n, PLANES, 100), dtype=np.uint8)
+    planes[:, :len(ka.CLASSES)] = classes[:, None, :] == np.arange(len(ka.CLASSES), dtype=np.uint8)[None, :, None]
+    planes[:, len(ka.CLASSES)] = _ROOF
+    visible = [state._state['visible'] for state in states]
+    scalars = np.zeros((n, SCALARS), dtype=np.float32)
+    scalars[np.arange(n), [_KINGSTATUS[v['king']] for v in visible]] = 1
+    scalars[:, 3] = [v['killed']['knights'] for v in visible]
+    scalars[:, 4] = [v['killed']['assassins'] for v in visible]
+    scalars[:, 5] = [len(v['arrested']) for v in visible]
+    scalars[:, 6:10] = [v['card'] for v in visible]
+    scalars[:, 10] = [state.player for state in states]
+    return planes.reshape(n, PLANES, 10, 10), scalars
+
+
+def states(game_record):
+    '''Generate the states of a recorded game, after every valid move.
+
+    Pre: 'game_record' is a lib.record.GameRecord of a King & Assassins game
+    Post: Copies of the states where a card has been drawn have been generated.
+    '''
+    server = ka.KingAndAssassinsServer.fromrecord(game_record.header)
+    for server in record.positions(server, game_record):
+        if server._state.budget(0) is not None:
+            yield server._state.copy()
+
+
+def _label(winner):
+    # Outcome from the point of view of player 1
+    return 0.0 if winner is None or winner == -1 else 1.0 if winner == 1 else -1.0
+
+
+def encoderecord(game_record):
+    '''Encode a recorded game as a tuple (planes, scalars, labels).
+
+    Pre: 'game_record' is a lib.record.GameRecord of a King & Assassins game
+    Post: The returned value is None if the game has no state, or if it was
+          forfeited, since its outcome says nothing about the positions.
+    '''
+    if game_record.forfeit is not None:
+        return None
+    batch = list(states(game_record))
+    if not batch:
+        return None
+    planes, scalars = encode(batch)
+    return planes, scalars, np.full(len(batch), _label(game_record.winner), dtype=np.float32)
+
+
+def _playgame(job):
+    seed, assassins, engine, budget, playouts = job
+    recorder = record.RecordBuffer()
+    server = ka.KingAndAssassinsServer(seed=seed, recorder=recorder)
+    players = [
+        ka.KingAndAssassinsClient('player0', None, engine=ka.makeengine(assassins, budget, playouts)),
+        ka.KingAndAssassinsClient('player1', None, engine=ka.makeengine(engine, budget, playouts))
+    ]
+    try:
+        server.playlocal(players)
+    finally:
+        for player in players:
+            player.close()
+    return encoderecord(recorder.records[0])
+
+
+def _replaygame(line):
+    return encoderecord(record.GameRecord.loads(line))
+
+
+class ShardWriter:
+    '''Class representing a writer of fixed-size shards of samples.
+
+    The samples are buffered in preallocated arrays of 'size' samples, and
+    every full buffer is written as .npy files that can be memory-mapped
+    with np.load(mmap_mode='r'): PREFIX-NNNNN-planes.npy, -scalars.npy and
+    -labels.npy (or as one PREFIX-NNNNN.npz file if 'compress' is True).
+    '''
+    def __init__(self, prefix, size=65536, compress=False):
+        self.__prefix = prefix
+        self.__size = size
+        self.__compress = compress
+        self.__planes = np.empty((size, PLANES, 10, 10), dtype=np.uint8)
+        self.__scalars = np.empty((size, SCALARS), dtype=np.float32)
+        self.__labels = np.empty(size, dtype=np.float32)
+        self.__count = 0
+        self.__shards = 0
+        self.__samples = 0
+
+    @property
+    def shards(self):
+        return self.__shards
+
+    @property
+    def samples(self):
+        return self.__samples
+
+    def write(self, planes, scalars, labels):
+        '''Add samples, writing the shards that get full.'''
+        start = 0
+        while start < len(labels):
+            count = min(len(labels) - start, self.__size - self.__count)
+            end = self.__count + count
+            self.__planes[self.__count:end] = planes[start:start + count]
+            self.__scalars[self.__count:end] = scalars[start:start + count]
+            self.__labels[self.__count:end] = labels[start:start + count]
+            self.__count = end
+            start += count
+            if self.__count == self.__size:
+                self.flush()
+
+    def flush(self):
+        '''Write the buffered samples as a (possibly smaller) shard.'''
+        if self.__count == 0:
+            return
+        n = self.__count
+        name = '{}-{:05d}'.format(self.__prefix, self.__shards)
+        arrays = {'planes': self.__planes[:n], 'scalars': self.__scalars[:n], 'labels': self.__labels[:n]}
+        if self.__compress:
+            np.savez_compressed(name + '.npz', **arrays)
+        else:
+            for key, array in arrays.items():
+                shard = np.lib.format.open_memmap('{}-{}.npy'.format(name, key), mode='w+',
+                                                  dtype=array.dtype, shape=array.shape)
+                shard[:] = array
+                shard.flush()
+                del shard
+        self.__shards += 1
+        self.__samples += n
+        self.__count = 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='King & Assassins training data')
+    parser.add_argument('--games', help='number of games to play (default: 1000)', type=int, default=1000)
+    parser.add_argument('--records', help='replay the games of this record file instead of playing')
+    parser.add_argument('--workers', help='worker processes (default: number of CPUs)', type=int,
+                        default=os.cpu_count())
+    parser.add_argument('--seed', help='seed of the first game (default: 0)', type=int, default=0)
+    parser.add_argument('--engine', help='search engine playing for player 1 (default: ismcts)',
+                        choices=['alphabeta', 'expectimax', 'ismcts'], default='ismcts')
+    parser.add_argument('--assassins', help='search engine playing for player 0 (default: alphabeta)',
+                        choices=['alphabeta', 'expectimax', 'ismcts'], default='alphabeta')
+    parser.add_argument('--budget', help='thinking time per turn in seconds (default: 0.1)', type=float, default=0.1)
+    parser.add_argument('--playouts', help='ISMCTS playouts per turn (default: 200)', type=int, default=200)
+    parser.add_argument('--output', help='prefix of the shard files (default: data/shard)', default='data/shard')
+    parser.add_argument('--shardsize', help='samples per shard (default: 65536)', type=int, default=65536)
+    parser.add_argument('--compress', help='write compressed .npz shards', action='store_true')
+    args = parser.parse_args()
+
+    if os.path.dirname(args.output):
+        os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    writer = ShardWriter(args.output, args.shardsize, args.compress)
+    with multiprocessing.Pool(args.workers) as pool:
+        if args.records is not None:
+            with open(args.records, 'rb') as file:
+                results = pool.imap_unordered(_replaygame, (line for line in file if line.strip()), chunksize=16)
+                for result in results:
+                    if result is not None:
+                        writer.write(*result)
+        else:
+            jobs = ((args.seed + i, args.assassins, args.engine, args.budget, args.playouts) for i in range(args.games))
+            for result in pool.imap_unordered(_playgame, jobs):
+                if result is not None:
+                    writer.write(*result)
+    writer.flush()
+    print('{} samples in {} shards'.format(writer.samples, writer.shards))